@@ -9,6 +9,7 @@ https://docs.djangoproject.com/en/5.2/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
+import tempfile
 from decouple import config
 from pathlib import Path
 
@@ -32,6 +33,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     # allauth
     'allauth',
     'allauth.account',
@@ -39,7 +41,6 @@ INSTALLED_APPS = [
     'django_jsonform',
     'crispy_forms',
     'crispy_bootstrap5',
-    'bulk_update_or_create',
     'cachalot',
     'auditlog',
     'django_crontab',
@@ -52,6 +53,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'apps.core.middleware.RequestMetricsMiddleware',
     'apps.core.middleware.GlobalExceptionHandlingMiddleware',
     'allauth.account.middleware.AccountMiddleware',
     'django.middleware.security.SecurityMiddleware',
@@ -61,6 +63,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'apps.core.middleware.AuditBufferMiddleware',
     'auditlog.middleware.AuditlogMiddleware',
 ]
 
@@ -161,9 +164,34 @@ AUDITLOG_EXCLUDE_TRACKING_MODELS = (
     "academic.evaluation",
     "academic.course",
 )
+# audit log entries a request collects before they are written with one bulk_create
+AUDITLOG_BATCH_SIZE = 500
+
+# a score at or above this counts as a pass in the score statistics
+SCORE_PASS_MARK = 50
+
+# months of activities kept by the activity_partitions command, None keeps them all
+ACTIVITY_RETENTION_MONTHS = None
+
+# months of audit log kept by the audit_partitions command, None keeps them all
+AUDITLOG_RETENTION_MONTHS = 12
+
+# seconds a user's timetable stays cached, schedule writes outdate it before that
+TIMETABLE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# request metrics served at /metrics, every worker writes its totals in there for the others to add up.
+# /dev/shm is a tmpfs so they stay in memory
+METRICS_DIR = Path('/dev/shm/ums-metrics') if Path('/dev/shm').is_dir() else Path(tempfile.gettempdir()) / 'ums-metrics'
+# seconds a worker keeps its latest numbers to itself, at most
+METRICS_FLUSH_SECONDS = 5
+# the scraper sends `Authorization: Bearer <token>`, without a token only logged in staff can read /metrics
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
 
 # crontab
-# every 4 week, call python manage.py auditlogflush --yes
+# every night, create the next audit log and activity partitions and drop the ones past retention
 CRONJOBS = [
-    ('0 0 12 1 1/1 ? *', 'django.core.management.call_command', ['auditlogflush', '--yes'])
+    ('0 2 * * *', 'django.core.management.call_command', ['audit_partitions']),
+    ('0 2 * * *', 'django.core.management.call_command', ['activity_partitions']),
+    # build the answer indexes of activity templates saved since, and again those whose build failed
+    ('*/10 * * * *', 'django.core.management.call_command', ['sync_activity_indexes']),
 ]
\ No newline at end of file
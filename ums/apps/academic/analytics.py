@@ -0,0 +1,131 @@
+import time
+from collections import Counter
+from django.core.cache import cache
+from django.db import connection
+from .models import Evaluation, EvaluationTemplate
+
+# answers are kept as counts and sums so schedules can be added up per course or professor.
+# a cached schedule is stamped with the template version, the generation and the version of the schedule
+# it was computed at. a submit bumps the version of its schedule and a bulk delete of evaluations the generation,
+# after they commit, so a result computed from before can't be taken for a current one
+GENERATION_KEY = 'evaluation_analytics:generation'
+TIMEOUT = 60 * 60 * 24
+NUMERIC_TYPES = ('integer', 'number')
+CHOICE_TYPES = ('dropdown', 'checkbox')
+
+def _key(schedule_id):
+    return f'evaluation_analytics:{schedule_id}'
+
+def _version_key(schedule_id):
+    return f'evaluation_analytics:version:{schedule_id}'
+
+def _seed():
+    # a counter that went missing starts somewhere new, or entries stamped before it went could match again
+    return time.time_ns()
+
+def _counters(keys):
+    """
+    {key: value} of the counters, the missing ones seeded
+    """
+    counters = cache.get_many(keys)
+    if missing := [key for key in keys if key not in counters]:
+        for key in missing:
+            cache.add(key, _seed(), None)
+        counters.update(cache.get_many(missing))
+    return counters
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, _seed(), None)
+
+def get_schedule_analytics(schedule_ids):
+    """
+    {schedule id: {'responses': n, 'questions': {title: {'count': n, 'sum': s} or {'counts': {answer: n}}}}}
+    for the numeric and choice questions of the current template.
+    cached per schedule, the ones missing are aggregated together in a single query
+    """
+    template_version, questions = EvaluationTemplate.objects.values_list('version', 'question_definition').get()
+    # the counters are read before the evaluations, a submit committing in between bumps them past the stamp
+    counters = _counters([GENERATION_KEY, *map(_version_key, schedule_ids)])
+    stamp = lambda schedule_id: (counters.get(GENERATION_KEY), template_version, counters.get(_version_key(schedule_id)))
+    cached = cache.get_many([_key(schedule_id) for schedule_id in schedule_ids])
+    analytics = {}
+    for schedule_id in schedule_ids:
+        cached_stamp, data = cached.get(_key(schedule_id), (None, None))
+        if cached_stamp == stamp(schedule_id):
+            analytics[schedule_id] = data
+
+    missing = [schedule_id for schedule_id in schedule_ids if schedule_id not in analytics]
+    if missing:
+        computed = _aggregate(missing, questions)
+        cache.set_many({_key(schedule_id): (stamp(schedule_id), data) for schedule_id, data in computed.items()}, TIMEOUT)
+        analytics.update(computed)
+    return analytics
+
+def invalidate_schedule_analytics(schedule_id):
+    _bump(_version_key(schedule_id))
+
+def invalidate_all_analytics():
+    _bump(GENERATION_KEY)
+
+def combine(analytics):
+    """
+    Add up the analytics of several schedules and turn the sums into averages
+    """
+    responses = 0
+    numbers = {}
+    choices = {}
+    for data in analytics:
+        responses += data['responses']
+        for title, answer in data['questions'].items():
+            if 'counts' in answer:
+                choices.setdefault(title, Counter()).update(answer['counts'])
+            else:
+                count, total = numbers.get(title, (0, 0))
+                numbers[title] = (count + answer['count'], total + answer['sum'])
+    return {
+        'responses': responses,
+        'averages': {title: round(total / count, 2) for title, (count, total) in numbers.items()},
+        'counts': {title: counts.most_common() for title, counts in choices.items()},
+    }
+
+def _aggregate(schedule_ids, questions):
+    numeric = [q['title'] for q in questions if q['type'] in NUMERIC_TYPES]
+    choice = [q['title'] for q in questions if q['type'] in CHOICE_TYPES]
+    table = connection.ops.quote_name(Evaluation._meta.db_table)
+
+    # one row per (schedule, question, answer), the answers never leave postgres
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT schedule_id, NULL, NULL, COUNT(*), NULL
+            FROM {table}
+            WHERE schedule_id = ANY(%s)
+            GROUP BY schedule_id
+            UNION ALL
+            SELECT e.schedule_id, q.key, NULL, COUNT(*), SUM((q.value #>> '{{}}')::numeric)
+            FROM {table} e CROSS JOIN jsonb_each(e.response) q
+            WHERE e.schedule_id = ANY(%s) AND q.key = ANY(%s) AND jsonb_typeof(q.value) = 'number'
+            GROUP BY e.schedule_id, q.key
+            UNION ALL
+            SELECT e.schedule_id, q.key, a.answer, COUNT(*), NULL
+            FROM {table} e CROSS JOIN jsonb_each(e.response) q
+            CROSS JOIN LATERAL jsonb_array_elements_text(
+                CASE jsonb_typeof(q.value) WHEN 'array' THEN q.value ELSE jsonb_build_array(q.value) END
+            ) a(answer)
+            WHERE e.schedule_id = ANY(%s) AND q.key = ANY(%s) AND jsonb_typeof(q.value) IN ('array', 'string')
+            GROUP BY e.schedule_id, q.key, a.answer
+        """, [schedule_ids, schedule_ids, numeric, schedule_ids, choice])
+        rows = cursor.fetchall()
+
+    analytics = {schedule_id: {'responses': 0, 'questions': {}} for schedule_id in schedule_ids}
+    for schedule_id, title, answer, count, total in rows:
+        data = analytics[schedule_id]
+        if title is None:
+            data['responses'] = count
+        elif answer is None:
+            data['questions'][title] = {'count': count, 'sum': total}
+        else:
+            data['questions'].setdefault(title, {'counts': {}})['counts'][answer] = count
+    return analytics
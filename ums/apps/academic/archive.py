@@ -0,0 +1,97 @@
+from auditlog.models import LogEntry
+from django.db import connection, transaction
+from apps.core.audit import log_bulk
+from apps.users.models import Student, User
+from .analytics import invalidate_all_analytics
+from .models import (ArchivedEvaluation, ArchivedSchedule, ArchivedScore, ArchivedStudent, Class, Course,
+                     Evaluation, Schedule, Score, ScoreStats, WEEKDAYS)
+from .timetable import invalidate_timetables
+from .transcript import invalidate_transcripts
+
+# (live model, archive model) in the order the rows are moved
+MOVES = [(Student, ArchivedStudent), (Schedule, ArchivedSchedule), (Score, ArchivedScore), (Evaluation, ArchivedEvaluation)]
+
+def archive_counts(class_ids):
+    """
+    {live model: rows} archive_classes would move out of the live tables
+    """
+    students = Student.objects.filter(_class__in=class_ids)
+    schedules = Schedule.objects.filter(_class__in=class_ids)
+    return {
+        Student: students.count(),
+        Schedule: schedules.count(),
+        Score: Score.objects.filter(student__in=students).count(),
+        Evaluation: (Evaluation.objects.filter(student__in=students) | Evaluation.objects.filter(schedule__in=schedules)).count(),
+    }
+
+def archive_classes(class_ids):
+    """
+    Move the students of the classes with their scores and evaluations, and the schedules of the classes
+    with theirs, to the archive tables, with one statement per table in one transaction.
+    the classes and the users stay, the score statistics of the classes go. returns {live model: rows moved}
+    """
+    class_ids = list(class_ids)
+    qn = connection.ops.quote_name
+    table = lambda model: qn(model._meta.db_table)
+    class_column = qn(Student._meta.get_field('_class').column)
+    students = f'SELECT id FROM {table(Student)} WHERE {class_column} = ANY(%(classes)s)'
+    schedules = f'SELECT id FROM {table(Schedule)} WHERE {class_column} = ANY(%(classes)s)'
+    days = ', '.join(WEEKDAYS)
+    moved = {}
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        # the parents are copied first and deleted last, the rows that reference them are moved in between.
+        # a student or schedule added to the classes in the meantime would be deleted without being archived,
+        # so they can't be written until the commit. reads go on
+        cursor.execute(f'LOCK TABLE {table(Schedule)}, {table(Student)} IN SHARE ROW EXCLUSIVE MODE')
+        cursor.execute(f"""
+            INSERT INTO {table(ArchivedStudent)} (id, user_id, first_name, last_name, faculty_id, program_id,
+                _class_id, class_name, generation, archived_at)
+            SELECT st.id, st.user_id, u.first_name, u.last_name, c.faculty_id, c.program_id, c.id, c.name, c.generation, now()
+            FROM {table(Student)} st
+            JOIN {table(User)} u ON u.id = st.user_id
+            JOIN {table(Class)} c ON c.id = st.{class_column}
+            WHERE st.{class_column} = ANY(%(classes)s)
+        """, {'classes': class_ids})
+        moved[Student] = cursor.rowcount
+        cursor.execute(f"""
+            INSERT INTO {table(ArchivedSchedule)} (id, professor_id, course_id, course_name, year, faculty_id, program_id,
+                _class_id, {days}, archived_at)
+            SELECT s.id, s.professor_id, s.course_id, c.name, c.year, c.faculty_id, c.program_id, s.{class_column},
+                {', '.join(f's.{day}' for day in WEEKDAYS)}, now()
+            FROM {table(Schedule)} s
+            JOIN {table(Course)} c ON c.id = s.course_id
+            WHERE s.{class_column} = ANY(%(classes)s)
+        """, {'classes': class_ids})
+        moved[Schedule] = cursor.rowcount
+        cursor.execute(f"""
+            WITH moved AS (
+                DELETE FROM {table(Score)} WHERE student_id IN ({students})
+                RETURNING student_id, course_id, score
+            )
+            INSERT INTO {table(ArchivedScore)} (student_id, course_id, course_name, year, score)
+            SELECT m.student_id, m.course_id, c.name, c.year, m.score
+            FROM moved m JOIN {table(Course)} c ON c.id = m.course_id
+        """, {'classes': class_ids})
+        moved[Score] = cursor.rowcount
+        cursor.execute(f"""
+            WITH moved AS (
+                DELETE FROM {table(Evaluation)} WHERE student_id IN ({students}) OR schedule_id IN ({schedules})
+                RETURNING schedule_id, student_id, response
+            )
+            INSERT INTO {table(ArchivedEvaluation)} (schedule_id, student_id, response)
+            SELECT schedule_id, student_id, response FROM moved
+        """, {'classes': class_ids})
+        moved[Evaluation] = cursor.rowcount
+        # the slots of the schedules go with them (ON DELETE CASCADE)
+        cursor.execute(f'DELETE FROM {table(Schedule)} WHERE {class_column} = ANY(%(classes)s)', {'classes': class_ids})
+        cursor.execute(f'DELETE FROM {table(Student)} WHERE {class_column} = ANY(%(classes)s)', {'classes': class_ids})
+        cursor.execute(f'DELETE FROM {table(ScoreStats)} WHERE {class_column} = ANY(%(classes)s)', {'classes': class_ids})
+
+        for model, archive_model in MOVES:
+            log_bulk(model, LogEntry.Action.DELETE, moved[model])
+            log_bulk(archive_model, LogEntry.Action.CREATE, moved[model])
+        invalidate_timetables()
+        transaction.on_commit(invalidate_all_analytics)
+        transaction.on_commit(lambda: invalidate_transcripts(class_ids))
+    return moved
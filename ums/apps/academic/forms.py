@@ -1,91 +1,235 @@
+from collections import defaultdict
+from auditlog.models import LogEntry
 from django import forms
+from django.core.cache import cache
 from django.db import transaction
+from django.db.models import Q
+from django.forms.models import BaseInlineFormSet, modelform_factory
+from django.utils.functional import cached_property
+from django_jsonform.widgets import JSONFormWidget
+from apps.core.audit import log_bulk
+from apps.core.constraints import constraint_errors
+from apps.core.forms import AutocompleteSelect, PrefetchedModelChoiceField, json_to_schema, schema_to_validator
 from apps.users.models import User
-from .models import Score, Schedule, Course
-
-def create_score_form_class(schedule_pk):
-    schedule = Schedule.objects.select_related('course', '_class').get(pk=schedule_pk)
-    students = schedule._class.students.all()
-    existing_scores = {
-        score.student_id: score.score 
-        for score in Score.objects.filter(student__in=students, course=schedule.course)
-    }
-
-    class ScoreBulkCreateForm(forms.Form):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-            for student in students:
-                self.fields[f'score_{student.id}'] = forms.IntegerField(
-                    label=student,
-                    min_value=0,
-                    max_value=100,
-                    initial=existing_scores.get(student.id, 0),
-                )
-        
-        @transaction.atomic
-        def save(self):
-            data = self.cleaned_data
-            score_objects = []
-            for student in students:
-                score_value = data.get(f'score_{student.id}')
-                # Only process if score is different from inital value
-                if score_value == existing_scores.get(student.id):
-                    continue
-                score_objects.append(
-                    Score(
-                        student=student,
-                        course=schedule.course,
-                        score=score_value
-                    )
-                )            
-            if score_objects:
-                Score.objects.bulk_update_or_create(
-                    score_objects,
-                    ['score'],  # Fields to update
-                    match_field='student'  # Field to match on for updates
-                )
-
-    return ScoreBulkCreateForm
-    
+from .models import Schedule, Course, Evaluation, EvaluationTemplate
+from .imports import COLUMNS
+from .timetable import invalidate_timetables
+
+class EvaluationForm(forms.ModelForm):
+    """
+    Checks the response against the template it was compiled from, see get_evaluation_form_class.
+    the evaluation itself is inserted by Evaluation.objects.submit, the form never saves
+    """
+    @staticmethod
+    def validate_response(response):
+        pass
+
+    def clean_response(self):
+        response = self.cleaned_data['response']
+        self.validate_response(response)
+        return response
+
+# {template version: form class}, compiled at most once per version in each process
+_evaluation_forms = {}
+
+def get_evaluation_form_class():
+    """
+    The evaluation form built from the current EvaluationTemplate.
+    the current version is shared through the cache so a template saved on one worker
+    is picked up by all of them, the template itself is only read when that version wasn't compiled yet
+    """
+    version = cache.get(EvaluationTemplate.VERSION_CACHE_KEY)
+    if version not in _evaluation_forms:
+        version, question_definition = EvaluationTemplate.objects.values_list('version', 'question_definition').get()
+        # add, not set: a template saved since has put its newer version there already
+        cache.add(EvaluationTemplate.VERSION_CACHE_KEY, version, EvaluationTemplate.VERSION_CACHE_TIMEOUT)
+        if version not in _evaluation_forms:
+            # older versions will never be asked for again
+            _evaluation_forms.clear()
+            schema = json_to_schema(question_definition)
+            _evaluation_forms[version] = modelform_factory(Evaluation, form=EvaluationForm, fields=['response'], widgets={
+                'response': JSONFormWidget(schema=schema)
+            })
+            _evaluation_forms[version].validate_response = staticmethod(schema_to_validator(schema))
+    return _evaluation_forms[version]
+
 class ScheduleForm(forms.ModelForm):
-    # add the prof query field to get or create
-    first_name = forms.CharField()
-    last_name = forms.CharField()
+    """
+    A schedule row of a class. inside ScheduleFormSet the course and professor choices
+    are fetched once for every form and the rows are checked for uniqueness by the formset
+    """
+    # the professor is picked by id through the autocomplete.
+    # the names (and email if ambiguous) are a fallback, the formset resolves them in one go
+    professor = forms.ModelChoiceField(
+        queryset=User.objects.none(),
+        required=False,
+        widget=AutocompleteSelect('users:autocomplete_user'),
+    )
+    first_name = forms.CharField(required=False, widget=forms.HiddenInput())
+    last_name = forms.CharField(required=False, widget=forms.HiddenInput())
     email = forms.CharField(required=False, widget=forms.HiddenInput())
     
     class Meta:
         model = Schedule
-        fields = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun', 'course', '_class']   
+        fields = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun', 'course', 'professor', '_class']
 
-    def __init__(self, *args, request, **kwargs):
+    def __init__(self, *args, request, courses=None, professors=None, **kwargs):
         super().__init__(*args, **kwargs)
         # filter the course choices based on the current affiliation
-        self.fields['course'].queryset = Course.objects.get_queryset(request=request)
-        # populate the first_name and last_name fields if have self.object
-        if self.instance.pk:
-            self.fields['first_name'].initial = self.instance.professor.first_name
-            self.fields['last_name'].initial = self.instance.professor.last_name
+        course_queryset = Course.objects.get_queryset(request=request)
+        professor_queryset = User.objects.get_queryset(request=request)
+        self.shared = courses is not None
+        if self.shared:
+            self.fields['course'] = PrefetchedModelChoiceField(course_queryset, courses)
+            self.fields['professor'] = PrefetchedModelChoiceField(
+                professor_queryset, professors, required=False, widget=self.fields['professor'].widget
+            )
+        else:
+            self.fields['course'].queryset = course_queryset
+            self.fields['professor'].queryset = professor_queryset
 
     def clean(self):
-        data = self.cleaned_data
-        filters = {'first_name': data['first_name'], 'last_name': data['last_name']}
-        if data.get('email'):
-            filters['email'] = data['email']
-        try:
-            data['professor'] = User.objects.get(**filters)
-        except User.DoesNotExist:
-            self.add_error('first_name', f'Professor with this name does not exist')
-        except User.MultipleObjectsReturned:
-            # add an email field to filter the professor
-            self.fields['email'].widget = forms.EmailInput()
-            self.add_error('email', f'Multiple professors with the same name found. Please specify an email')
-
+        data = super().clean()
+        if not data.get('professor') and not (data.get('first_name') and data.get('last_name')):
+            self.add_error('professor', 'This field is required.')
         return data
 
+    def _get_validation_exclusions(self):
+        exclude = super()._get_validation_exclusions()
+        if self.shared:
+            # the prefetched choices already proved these exist, skip a query per fk
+            exclude |= {'course', 'professor'}
+        return exclude
+
+    def validate_unique(self):
+        # the formset holds every row of the class and checks them against each other
+        if not self.shared:
+            super().validate_unique()
+
+class ScheduleFormSet(BaseInlineFormSet):
+    """
+    Inline formset for the schedules of a class.
+    the choices are fetched once for all forms, professors submitted by name are resolved
+    in one query and the rows are saved with one bulk operation per kind of change
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.queryset = self.queryset.select_related('professor')
+
+    @cached_property
+    def courses(self):
+        return list(Course.objects.get_queryset(request=self.form_kwargs['request']))
+
+    @cached_property
+    def professors(self):
+        # the professors already on the rows plus the ones picked in this submission
+        professors = {str(schedule.professor_id): schedule.professor for schedule in self.get_queryset()}
+        if self.is_bound:
+            posted = {self.data.get(self.add_prefix(i) + '-professor') for i in range(self.total_form_count())}
+            posted = [pk for pk in posted if pk and pk.isdigit() and pk not in professors]
+            if posted:
+                queryset = User.objects.get_queryset(request=self.form_kwargs['request'])
+                professors.update((str(professor.pk), professor) for professor in queryset.filter(pk__in=posted))
+        return list(professors.values())
+
+    def get_form_kwargs(self, index):
+        kwargs = super().get_form_kwargs(index)
+        kwargs['courses'] = self.courses
+        kwargs['professors'] = self.professors
+        return kwargs
+
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        # validate the row ids against the rows already loaded instead of a query per form
+        name = self._pk_field.name
+        field = form.fields[name]
+        form.fields[name] = PrefetchedModelChoiceField(
+            field.queryset, self.get_queryset(), initial=field.initial, required=False, widget=field.widget
+        )
+
+    def clean(self):
+        super().clean()
+        forms = [
+            form for form in self.forms
+            if form.cleaned_data and not form.errors and not self._should_delete_form(form)
+        ]
+        self._resolve_professors([form for form in forms if not form.cleaned_data.get('professor')])
+
+        # every row of the class is loaded, so the unique check is done in memory instead of per form
+        posted = {form.instance.pk for form in self.initial_forms}
+        taken = {(s.course_id, s.professor_id) for s in self.get_queryset() if s.pk not in posted}
+        for form in forms:
+            if form.errors:
+                continue
+            key = (form.cleaned_data['course'].pk, form.cleaned_data['professor'].pk)
+            if key in taken:
+                form.add_error(None, 'This professor already teaches this course to this class.')
+            taken.add(key)
+
+    def _resolve_professors(self, forms):
+        """
+        find the professors that were submitted by name with one query
+        """
+        if not forms:
+            return
+
+        q = Q()
+        for form in forms:
+            data = form.cleaned_data
+            q |= Q(first_name=data['first_name'], last_name=data['last_name'])
+        professors = defaultdict(list)
+        for professor in User.objects.get_queryset(request=self.form_kwargs['request']).filter(q):
+            professors[(professor.first_name, professor.last_name)].append(professor)
+
+        for form in forms:
+            data = form.cleaned_data
+            matches = professors[(data['first_name'], data['last_name'])]
+            if data.get('email'):
+                matches = [professor for professor in matches if professor.email == data['email']]
+            if not matches:
+                form.add_error('professor', 'Professor with this name does not exist')
+            elif len(matches) > 1:
+                form.add_error('professor', 'Multiple professors with the same name found. Please pick one')
+            else:
+                data['professor'] = form.instance.professor = matches[0]
+
+    @transaction.atomic
     def save(self, commit=True):
-        data = self.cleaned_data
-        self.instance = super().save(commit=False)
-        self.instance.professor = data['professor']
-        if commit:
-            self.instance.save()
-        return self.instance
\ No newline at end of file
+        """
+        deletes, updates and creates the rows with one query each instead of one per form
+        """
+        if not commit:
+            return super().save(commit=False)
+
+        self.new_objects, self.changed_objects, self.deleted_objects = [], [], []
+        for form in self.initial_forms:
+            if self.can_delete and self._should_delete_form(form):
+                self.deleted_objects.append(form.instance)
+            elif form.has_changed():
+                self.changed_objects.append((form.save(commit=False), form.changed_data))
+        for form in self.extra_forms:
+            if form.has_changed() and not (self.can_delete and self._should_delete_form(form)):
+                self.new_objects.append(form.save(commit=False))
+
+        changed = [obj for obj, _ in self.changed_objects]
+        if self.deleted_objects:
+            Schedule.objects.filter(pk__in=[obj.pk for obj in self.deleted_objects]).delete()
+        # the slots of the rows are checked for overlaps by the database as they are written
+        with constraint_errors(Schedule.OVERLAP_ERRORS):
+            if changed:
+                fields = [name for name in self.form._meta.fields if name != self.fk.name]
+                Schedule.objects.bulk_update(changed, fields)
+                log_bulk(Schedule, LogEntry.Action.UPDATE, len(changed))
+            if self.new_objects:
+                Schedule.objects.bulk_create(self.new_objects)
+                log_bulk(Schedule, LogEntry.Action.CREATE, len(self.new_objects))
+        if self.deleted_objects or changed or self.new_objects:
+            invalidate_timetables()
+        return changed + self.new_objects
+
+class ScheduleImportForm(forms.Form):
+    file = forms.FileField(help_text='a .csv or .xlsx whose first row has the columns ' + ', '.join(COLUMNS))
+
+class ClassRolloverForm(forms.Form):
+    generation = forms.IntegerField(help_text='the students of the classes of this generation move on')
+    step = forms.IntegerField(min_value=1, initial=1, help_text='to the class of the same name this many generations later')
@@ -0,0 +1,136 @@
+from collections import defaultdict
+from auditlog.models import LogEntry
+from django.db import transaction
+from django.db.models import Q
+from apps.core.audit import log_bulk
+from apps.core.constraints import constraint_errors
+from apps.users.models import User
+from .models import Class, Course, Schedule, ScheduleSlot, WEEKDAYS, format_timeslot, parse_timeslot
+from .timetable import invalidate_timetables
+
+# the columns of a schedule sheet, the professor is an email or username,
+# the course its name and year and the class its generation and name
+COLUMNS = ['professor', 'course', 'year', 'generation', 'class', *WEEKDAYS]
+
+def _lookup(queryset, keys):
+    """
+    {natural key: [objects]} of the rows of the queryset, each row under every key keys(row) gives it.
+    a key with more than one object is ambiguous
+    """
+    found = defaultdict(dict)
+    for obj in queryset:
+        for key in keys(obj):
+            found[key][obj.pk] = obj
+    return {key: list(objects.values()) for key, objects in found.items()}
+
+def _resolve(found, key, label):
+    matches = found.get(key, [])
+    if not matches:
+        return None, f'{label} {" ".join(key) if isinstance(key, tuple) else key} not found'
+    if len(matches) > 1:
+        return None, f'{label} {" ".join(key) if isinstance(key, tuple) else key} is ambiguous'
+    return matches[0], None
+
+def overlaps(intervals):
+    """
+    The (owner, earlier owner) pairs of the overlapping [start, end) intervals of (start, end, owner)
+    of one day of a professor or class, swept in start order
+    """
+    latest = None
+    for start, end, owner in sorted(intervals, key=lambda interval: interval[:2]):
+        if latest and start < latest[0]:
+            yield owner, latest[1]
+        if not latest or end > latest[0]:
+            latest = (end, owner)
+
+def import_schedules(request, rows):
+    """
+    Create the schedules of the rows of a schedule sheet (see COLUMNS) in the RLS scope of the request.
+    professors, courses and classes are resolved with one query each, then the rows are checked against
+    each other and the schedules already there, and written with one bulk_create only if none has a problem.
+    returns the schedules created and [(row number, error)], the first row of the sheet being its headers.
+    a schedule saved by someone else between the checks and the write still fails the import with
+    a ValidationError (an overlap) or an IntegrityError (the same professor, course and class)
+    """
+    values = lambda column: {row.get(column, '') for row in rows}
+    professors = _lookup(
+        User.objects.get_queryset(request=request).filter(Q(email__in=values('professor')) | Q(username__in=values('professor'))),
+        lambda user: {user.email, user.username},
+    )
+    courses = _lookup(
+        Course.objects.get_queryset(request=request).filter(name__in=values('course')),
+        lambda course: {(course.name, course.year)},
+    )
+    classes = _lookup(
+        Class.objects.get_queryset(request=request).filter(name__in=values('class')),
+        lambda _class: {(str(_class.generation), _class.name)},
+    )
+
+    errors = []
+    schedules = {}
+    slots = {}
+    for number, row in enumerate(rows, start=2):
+        professor, professor_error = _resolve(professors, row.get('professor', ''), 'professor')
+        course, course_error = _resolve(courses, (row.get('course', ''), row.get('year', '')), 'course')
+        _class, class_error = _resolve(classes, (row.get('generation', ''), row.get('class', '')), 'class')
+        row_errors = [error for error in (professor_error, course_error, class_error) if error]
+        row_slots = []
+        row_days = {}
+        for weekday, day in enumerate(WEEKDAYS):
+            if not row.get(day):
+                continue
+            if (slot := parse_timeslot(row[day])) is None:
+                row_errors.append(f'{day}: {row[day]!r} is not a timeslot like 08:00 - 09:30')
+            else:
+                row_slots.append((weekday, *slot))
+                # a sheet may space the slot out past the length of the day fields
+                row_days[day] = format_timeslot(*slot)
+        if row_errors:
+            errors.extend((number, error) for error in row_errors)
+            continue
+        schedules[number] = Schedule(professor=professor, course=course, _class=_class,
+                                     **{day: row_days.get(day) for day in WEEKDAYS})
+        slots[number] = row_slots
+
+    # the rows that resolved are checked on, so the whole sheet can be fixed at once.
+    # the same professor, course and class twice, in the sheet or already
+    keys = {}
+    for number, schedule in schedules.items():
+        key = (schedule.professor_id, schedule.course_id, schedule._class_id)
+        if key in keys:
+            errors.append((number, f'same professor, course and class as row {keys[key]}'))
+        keys.setdefault(key, number)
+    professor_ids = {schedule.professor_id for schedule in schedules.values()}
+    class_ids = {schedule._class_id for schedule in schedules.values()}
+    for key in Schedule.objects.filter(professor__in=professor_ids, _class__in=class_ids) \
+            .values_list('professor', 'course', '_class'):
+        if key in keys:
+            errors.append((keys[key], 'this professor already teaches this course to this class'))
+
+    # every day of every professor and class of the sheet, with the slots they already have
+    days = defaultdict(list)
+    for slot in ScheduleSlot.objects.filter(Q(professor__in=professor_ids) | Q(_class__in=class_ids)) \
+            .values('schedule', 'professor', '_class', 'weekday', 'start', 'end'):
+        owner = f"schedule {slot['schedule']}"
+        days['professor', slot['professor'], slot['weekday']].append((slot['start'], slot['end'], owner))
+        days['class', slot['_class'], slot['weekday']].append((slot['start'], slot['end'], owner))
+    for number, schedule in schedules.items():
+        for weekday, start, end in slots[number]:
+            days['professor', schedule.professor_id, weekday].append((start, end, number))
+            days['class', schedule._class_id, weekday].append((start, end, number))
+    for (kind, _, weekday), intervals in days.items():
+        for owner, other in overlaps(intervals):
+            if not isinstance(owner, int) and not isinstance(other, int):
+                continue
+            number, other = (owner, other) if isinstance(owner, int) else (other, owner)
+            other = f'row {other}' if isinstance(other, int) else other
+            errors.append((number, f'the {kind} is already busy on {WEEKDAYS[weekday]} with {other}'))
+    if errors:
+        return [], sorted(errors)
+
+    # the database checks the overlaps again, for schedules saved by others since
+    with transaction.atomic(), constraint_errors(Schedule.OVERLAP_ERRORS):
+        created = Schedule.objects.bulk_create(schedules.values(), batch_size=1000)
+        log_bulk(Schedule, LogEntry.Action.CREATE, len(created))
+        invalidate_timetables()
+    return created, []
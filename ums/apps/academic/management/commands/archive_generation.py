@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from apps.academic.archive import archive_classes, archive_counts
+from apps.academic.models import Class
+
+class Command(BaseCommand):
+    help = ("Move the students, schedules, scores and evaluations of a graduated generation's classes "
+            "to the archive tables, where their transcripts can still be read")
+
+    def add_arguments(self, parser):
+        parser.add_argument('generation', type=int)
+        parser.add_argument('--program', type=int, action='append', help='only the classes of this program, can be repeated')
+        parser.add_argument('--dry-run', action='store_true', help='count the rows that would move without moving them')
+
+    def handle(self, *args, **options):
+        classes = Class.objects.filter(generation=options['generation'])
+        if options['program']:
+            classes = classes.filter(program__in=options['program'])
+        class_ids = list(classes.values_list('pk', flat=True))
+        if not class_ids:
+            raise CommandError(f"no class of generation {options['generation']}")
+
+        if options['dry_run']:
+            counts = archive_counts(class_ids)
+        else:
+            counts = archive_classes(class_ids)
+        verb = 'would move' if options['dry_run'] else 'moved'
+        for model, rows in counts.items():
+            self.stdout.write(f'{verb} {rows} {model._meta.verbose_name_plural}')
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f"Archived {len(class_ids)} classes of generation {options['generation']}"))
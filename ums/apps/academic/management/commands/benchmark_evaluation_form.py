@@ -0,0 +1,69 @@
+import time
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from apps.organization.models import Faculty, Program
+from apps.users.models import User, Student
+from apps.academic import forms
+from apps.academic.models import Course, Class, Schedule, EvaluationTemplate
+from apps.academic.views import EvaluationCreateView
+
+class Command(BaseCommand):
+    help = 'Benchmark requests per second of the evaluation page with and without the compiled form'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300)
+        parser.add_argument('--questions', type=int, default=20)
+
+    def handle(self, *args, **options):
+        # everything is created inside a transaction that is rolled back at the end
+        with transaction.atomic():
+            request, schedule = self._setup(options['questions'])
+            view = EvaluationCreateView.as_view()
+
+            def get():
+                view(request, schedule_pk=schedule.pk).render()
+
+            def recompile_and_get():
+                # what every request used to do: read the template and build the form again
+                forms._evaluation_forms.clear()
+                cache.delete(EvaluationTemplate.VERSION_CACHE_KEY)
+                get()
+
+            get()
+            for name, func in [('recompiled every request', recompile_and_get), ('compiled once', get)]:
+                connection.queries_log.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    for _ in range(options['requests']):
+                        func()
+                    elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f"  {name:<26} {options['requests'] / elapsed:8.1f} req/s "
+                    f"{len(queries) / options['requests']:6.1f} queries/req"
+                )
+            transaction.set_rollback(True)
+        # the cached version belonged to the rolled back template
+        cache.delete(EvaluationTemplate.VERSION_CACHE_KEY)
+
+    def _setup(self, num_questions):
+        types = ['text', 'paragraph', 'integer', 'dropdown', 'checkbox']
+        EvaluationTemplate(question_definition=[
+            {'title': f'question {i}', 'type': types[i % len(types)], 'required': True, 'choices': ['a', 'b', 'c']}
+            for i in range(num_questions)
+        ]).save()
+        faculty = Faculty.objects.create(name='benchmark faculty')
+        program = Program.objects.create(name='benchmark program', faculty=faculty)
+        course = Course.objects.create(faculty=faculty, program=program, name='benchmark', year='1')
+        _class = Class.objects.create(faculty=faculty, program=program, generation=0, name='benchmark')
+        professor = User.objects.create(username='benchmark professor', email='benchmark-professor@example.com')
+        schedule = Schedule.objects.create(professor=professor, course=course, _class=_class)
+        user = User.objects.create(username='benchmark student', email='benchmark-student@example.com')
+        Student.objects.create(user=user, _class=_class)
+
+        request = RequestFactory().get('/')
+        request.user = user
+        request.session = {'permissions': ['add_evaluation'], 'selected_faculty': "None", 'selected_program': "None"}
+        return request, schedule
@@ -0,0 +1,72 @@
+import time
+from collections import defaultdict
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from apps.organization.models import Faculty, Program
+from apps.users.models import User, Student
+from apps.academic.models import Class
+
+class Command(BaseCommand):
+    help = 'Benchmark the class rollover against moving every student with its own save on a throwaway program'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=20000)
+        parser.add_argument('--classes', type=int, default=40)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        self.timings = defaultdict(list)
+        # everything is created inside a transaction that is rolled back at the end
+        with transaction.atomic():
+            program = self._setup(options['students'], options['classes'])
+            for generation in range(options['repeat']):
+                # each round moves the students one generation on, to classes created by the round
+                classes = Class.objects.filter(program=program, generation=generation)
+                self._time('rollover: preview', lambda: classes.rollover(dry_run=True))
+                self._time('rollover', lambda: classes.rollover())
+
+            # the per-row saves carry on from there, their classes created up front
+            for generation in range(options['repeat'], 2 * options['repeat']):
+                current = dict(Class.objects.filter(program=program, generation=generation).values_list('name', 'pk'))
+                following = Class.objects.bulk_create([
+                    Class(faculty_id=program.faculty_id, program=program, generation=generation + 1, name=name) for name in current
+                ])
+                target_of = {current[_class.name]: _class.pk for _class in following}
+                students = list(Student.objects.filter(_class__in=current.values()))
+
+                def save():
+                    for student in students:
+                        student._class_id = target_of[student._class_id]
+                        student.save(update_fields=['_class'])
+                self._time('save per student', save)
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"{options['students']} students in {options['classes']} classes, best of {options['repeat']}")
+        for name, runs in self.timings.items():
+            elapsed, queries = min(runs)
+            self.stdout.write(f'  {name:<36} {elapsed * 1000:8.1f} ms {queries:6} queries')
+
+    def _setup(self, num_students, num_classes):
+        faculty = Faculty.objects.create(name='benchmark faculty')
+        program = Program.objects.create(name='benchmark program', faculty=faculty)
+        classes = Class.objects.bulk_create([
+            Class(faculty=faculty, program=program, generation=0, name=f'benchmark {i}') for i in range(num_classes)
+        ])
+        users = User.objects.bulk_create([
+            User(username=f'benchmark{i}', first_name='bench', last_name=str(i), email=f'benchmark{i}@example.com')
+            for i in range(num_students)
+        ], batch_size=5000)
+        Student.objects.bulk_create([
+            Student(user=user, _class=classes[i % num_classes]) for i, user in enumerate(users)
+        ], batch_size=5000)
+        return program
+
+    def _time(self, name, func):
+        # the query log is capped, start each measurement with an empty one
+        connection.queries_log.clear()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+        self.timings[name].append((elapsed, len(queries)))
@@ -0,0 +1,66 @@
+import time
+from collections import defaultdict
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from apps.organization.models import Faculty, Program
+from apps.users.models import User, Student
+from apps.academic.models import Course, Class, Score
+
+class Command(BaseCommand):
+    help = 'Benchmark the score upsert against a per-row update_or_create on a throwaway class'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=200)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        self.timings = defaultdict(list)
+        # everything is created inside a transaction that is rolled back at the end
+        with transaction.atomic():
+            course, students = self._setup(options['students'])
+            # (name, score of the nth student)
+            rounds = [
+                ('insert', lambda n: n % 101),
+                ('update every score', lambda n: (n + 1) % 101),
+                ('nothing changed', lambda n: (n + 1) % 101),
+            ]
+            for _ in range(options['repeat']):
+                Score.objects.filter(course=course).delete()
+                for name, score in rounds:
+                    scores = [Score(student=s, course=course, score=score(n)) for n, s in enumerate(students)]
+                    self._time(f'upsert: {name}', lambda: Score.objects.upsert(scores))
+
+                Score.objects.filter(course=course).delete()
+                for name, score in rounds:
+                    self._time(f'update_or_create: {name}', lambda: [
+                        Score.objects.update_or_create(student=s, course=course, defaults={'score': score(n)})
+                        for n, s in enumerate(students)
+                    ])
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"{options['students']} students, best of {options['repeat']}")
+        for name, runs in self.timings.items():
+            elapsed, queries = min(runs)
+            self.stdout.write(f'  {name:<36} {elapsed * 1000:8.1f} ms {queries:6} queries')
+
+    def _setup(self, num_students):
+        faculty = Faculty.objects.create(name='benchmark faculty')
+        program = Program.objects.create(name='benchmark program', faculty=faculty)
+        course = Course.objects.create(faculty=faculty, program=program, name='benchmark', year='1')
+        _class = Class.objects.create(faculty=faculty, program=program, generation=0, name='benchmark')
+        users = User.objects.bulk_create([
+            User(username=f'benchmark{i}', first_name='bench', last_name=str(i), email=f'benchmark{i}@example.com')
+            for i in range(num_students)
+        ])
+        students = Student.objects.bulk_create([Student(user=user, _class=_class) for user in users])
+        return course, students
+
+    def _time(self, name, func):
+        # the query log is capped, start each measurement with an empty one
+        connection.queries_log.clear()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+        self.timings[name].append((elapsed, len(queries)))
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from apps.academic.models import ScoreStats
+
+class Command(BaseCommand):
+    help = 'Recompute the score statistics of every course and class from the scores'
+
+    def handle(self, *args, **options):
+        rows = ScoreStats.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the statistics of {rows} course/class pairs'))
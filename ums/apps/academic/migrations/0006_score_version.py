@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-19 16:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academic', '0005_alter_score_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='score',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
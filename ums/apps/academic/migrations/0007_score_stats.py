@@ -0,0 +1,55 @@
+# Generated by Django 5.2.3 on 2026-10-19 16:22
+
+import apps.academic.models
+import django.contrib.postgres.fields
+import django.db.models.deletion
+import django.db.models.expressions
+import django.db.models.functions.comparison
+import django.db.models.functions.math
+from django.conf import settings
+from django.db import migrations, models
+
+
+# count the scores that exist from before the statistics did, in 10 buckets.
+# the same numbers as ScoreStats.objects.rebuild, frozen here as the models may change
+HISTOGRAM = ', '.join(f'COUNT(*) FILTER (WHERE LEAST(GREATEST(sc.score * 10 / 100, 0), 9) = {i})' for i in range(10))
+REBUILD_SCORE_STATS = f"""
+    INSERT INTO academic_scorestats (course_id, _class_id, count, total, total_squares, passed, histogram)
+    SELECT sc.course_id, st._class_id, COUNT(*), SUM(sc.score), SUM(sc.score::bigint * sc.score),
+        COUNT(*) FILTER (WHERE sc.score >= %s), ARRAY[{HISTOGRAM}]
+    FROM academic_score sc
+    JOIN users_student st ON st.id = sc.student_id
+    WHERE st._class_id IS NOT NULL
+    GROUP BY sc.course_id, st._class_id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academic', '0006_score_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScoreStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.IntegerField(default=0)),
+                ('total', models.BigIntegerField(default=0)),
+                ('total_squares', models.BigIntegerField(default=0)),
+                ('passed', models.IntegerField(default=0)),
+                ('histogram', django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), default=apps.academic.models.empty_histogram, size=None)),
+                ('mean', models.GeneratedField(db_persist=True, expression=django.db.models.functions.comparison.Cast(django.db.models.expressions.CombinedExpression(django.db.models.functions.comparison.Cast('total', models.FloatField()), '/', django.db.models.functions.comparison.NullIf(models.F('count'), 0)), models.DecimalField(decimal_places=2, max_digits=6)), output_field=models.DecimalField(decimal_places=2, max_digits=6))),
+                ('stddev', models.GeneratedField(db_persist=True, expression=django.db.models.functions.comparison.Cast(django.db.models.functions.math.Sqrt(django.db.models.functions.math.Abs(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.functions.comparison.Cast('total_squares', models.FloatField()), '/', django.db.models.functions.comparison.NullIf(models.F('count'), 0)), '-', django.db.models.functions.math.Power(django.db.models.expressions.CombinedExpression(django.db.models.functions.comparison.Cast('total', models.FloatField()), '/', django.db.models.functions.comparison.NullIf(models.F('count'), 0)), 2)))), models.DecimalField(decimal_places=2, max_digits=6)), output_field=models.DecimalField(decimal_places=2, max_digits=6))),
+                ('pass_rate', models.GeneratedField(db_persist=True, expression=django.db.models.functions.comparison.Cast(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.functions.comparison.Cast('passed', models.FloatField()), '/', django.db.models.functions.comparison.NullIf(models.F('count'), 0)), '*', models.Value(100)), models.DecimalField(decimal_places=2, max_digits=5)), output_field=models.DecimalField(decimal_places=2, max_digits=5))),
+                ('_class', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='score_stats', to='academic.class')),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='academic.course')),
+            ],
+            options={
+                'verbose_name_plural': 'Score statistics',
+                'unique_together': {('course', '_class')},
+            },
+        ),
+        migrations.RunSQL([(REBUILD_SCORE_STATS, [settings.SCORE_PASS_MARK])], migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-19 16:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academic', '0007_score_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='evaluationtemplate',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-19 16:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academic', '0008_evaluation_template_version'),
+        ('users', '0004_user_name_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='evaluation',
+            index=models.Index(fields=['student', 'schedule'], name='evaluation_student_idx'),
+        ),
+    ]
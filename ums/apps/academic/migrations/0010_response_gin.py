@@ -0,0 +1,22 @@
+# Generated by Django 5.2.3 on 2026-10-19 16:30
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # built without locking out the writes to a big table
+    atomic = False
+
+    dependencies = [
+        ('academic', '0009_evaluation_student_idx'),
+        ('users', '0004_user_name_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='evaluation',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['response'], name='evaluation_response_gin', opclasses=['jsonb_path_ops']),
+        ),
+    ]
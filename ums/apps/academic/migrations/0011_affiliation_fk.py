@@ -0,0 +1,15 @@
+from django.db import migrations
+from apps.organization.operations import AddAffiliationForeignKey
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academic', '0010_response_gin'),
+        ('organization', '0002_program_faculty_unique'),
+    ]
+
+    operations = [
+        AddAffiliationForeignKey('course'),
+        AddAffiliationForeignKey('class'),
+    ]
@@ -0,0 +1,148 @@
+# Generated by Django 5.2.3 on 2026-10-19 16:48
+
+import apps.academic.models
+import apps.academic.queryset
+import django.contrib.postgres.constraints
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from django.conf import settings
+from django.contrib.postgres.operations import BtreeGistExtension
+from django.db import migrations, models
+
+
+# the slots of the schedules in `rows`, a day whose text isn't a timeslot like 08:00 - 09:30 has none.
+# the same parsing as apps.academic.models.parse_timeslot
+def slots_of(rows):
+    days = ', '.join(f"({weekday}, s.{day})" for weekday, day in enumerate(['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']))
+    return rf"""
+        INSERT INTO academic_scheduleslot (schedule_id, professor_id, _class_id, weekday, start, "end")
+        SELECT id, professor_id, _class_id, weekday, start, "end" FROM (
+            SELECT s.id, s.professor_id, s._class_id, d.weekday, m[2]::int AS start_minute, m[4]::int AS end_minute,
+                   m[1]::int * 60 + m[2]::int AS start, m[3]::int * 60 + m[4]::int AS "end"
+            FROM {rows} s
+            CROSS JOIN LATERAL (VALUES {days}) d (weekday, value)
+            CROSS JOIN LATERAL regexp_match(d.value, '^\s*(\d{{1,2}})[:.]?(\d{{2}})\s*-\s*(\d{{1,2}})[:.]?(\d{{2}})\s*$') m
+        ) slots
+        WHERE start_minute < 60 AND end_minute < 60 AND start < "end" AND "end" <= 1440
+    """
+
+
+def slots_trigger(operation):
+    # an update writes the slots of its rows again, the old ones first so rows can swap times
+    delete = 'DELETE FROM academic_scheduleslot WHERE schedule_id IN (SELECT id FROM new_rows);' if operation == 'UPDATE' else ''
+    return f"""
+        CREATE FUNCTION academic_schedule_slots_{operation.lower()}() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            {delete}
+            {slots_of('new_rows')};
+            RETURN NULL;
+        END $$;
+        CREATE TRIGGER academic_schedule_slots_{operation.lower()} AFTER {operation} ON academic_schedule
+        REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION academic_schedule_slots_{operation.lower()}();
+    """
+
+
+def drop_slots_trigger(operation):
+    return f"""
+        DROP TRIGGER academic_schedule_slots_{operation.lower()} ON academic_schedule;
+        DROP FUNCTION academic_schedule_slots_{operation.lower()}();
+    """
+
+
+def check_overlaps(apps, schema_editor):
+    # the schedules entered so far were never checked, they have to be fixed before the constraints can hold
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT DISTINCT LEAST(a.schedule_id, b.schedule_id), GREATEST(a.schedule_id, b.schedule_id)
+            FROM academic_scheduleslot a JOIN academic_scheduleslot b
+            ON a.weekday = b.weekday AND a.schedule_id <> b.schedule_id
+            AND (a.professor_id = b.professor_id OR a._class_id = b._class_id)
+            AND int4range(a.start, a."end") && int4range(b.start, b."end")
+            ORDER BY 1, 2
+        """)
+        if overlaps := cursor.fetchall():
+            raise ValueError(f"{len(overlaps)} pairs of schedules overlap, fix them first: "
+                             f"{', '.join(f'{a} and {b}' for a, b in overlaps[:20])}")
+
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academic', '0011_affiliation_fk'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        BtreeGistExtension(),
+        migrations.AlterField(
+            model_name='schedule',
+            name='fri',
+            field=models.CharField(blank=True, max_length=13, null=True, validators=[apps.academic.models.validate_timeslot]),
+        ),
+        migrations.AlterField(
+            model_name='schedule',
+            name='mon',
+            field=models.CharField(blank=True, max_length=13, null=True, validators=[apps.academic.models.validate_timeslot]),
+        ),
+        migrations.AlterField(
+            model_name='schedule',
+            name='sat',
+            field=models.CharField(blank=True, max_length=13, null=True, validators=[apps.academic.models.validate_timeslot]),
+        ),
+        migrations.AlterField(
+            model_name='schedule',
+            name='sun',
+            field=models.CharField(blank=True, max_length=13, null=True, validators=[apps.academic.models.validate_timeslot]),
+        ),
+        migrations.AlterField(
+            model_name='schedule',
+            name='thu',
+            field=models.CharField(blank=True, max_length=13, null=True, validators=[apps.academic.models.validate_timeslot]),
+        ),
+        migrations.AlterField(
+            model_name='schedule',
+            name='tue',
+            field=models.CharField(blank=True, max_length=13, null=True, validators=[apps.academic.models.validate_timeslot]),
+        ),
+        migrations.AlterField(
+            model_name='schedule',
+            name='wed',
+            field=models.CharField(blank=True, max_length=13, null=True, validators=[apps.academic.models.validate_timeslot]),
+        ),
+        migrations.CreateModel(
+            name='ScheduleSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField()),
+                ('start', models.PositiveSmallIntegerField()),
+                ('end', models.PositiveSmallIntegerField()),
+                ('_class', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='academic.class')),
+                ('professor', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('schedule', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='slots', to='academic.schedule')),
+            ],
+            options={
+                'indexes': [django.contrib.postgres.indexes.GistIndex(models.F('weekday'), apps.academic.queryset.IntRange('start', 'end'), name='schedule_slot_time_idx')],
+                'constraints': [models.CheckConstraint(condition=models.Q(('end__lte', 1440), ('start__lt', models.F('end')), ('weekday__lt', 7)), name='schedule_slot_valid')],
+            },
+        ),
+        migrations.RunSQL(
+            'ALTER TABLE academic_scheduleslot ADD CONSTRAINT academic_scheduleslot_schedule_fk '
+            'FOREIGN KEY (schedule_id) REFERENCES academic_schedule (id) ON DELETE CASCADE',
+            'ALTER TABLE academic_scheduleslot DROP CONSTRAINT academic_scheduleslot_schedule_fk',
+        ),
+        # the schedules can't change until the triggers keep their slots
+        migrations.RunSQL(['LOCK TABLE academic_schedule IN SHARE MODE', slots_of('academic_schedule')], migrations.RunSQL.noop),
+        migrations.RunPython(check_overlaps, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='scheduleslot',
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(expressions=[('professor', '='), ('weekday', '='), (apps.academic.queryset.IntRange('start', 'end'), '&&')], name='schedule_slot_professor_overlap'),
+        ),
+        migrations.AddConstraint(
+            model_name='scheduleslot',
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(expressions=[('_class', '='), ('weekday', '='), (apps.academic.queryset.IntRange('start', 'end'), '&&')], name='schedule_slot_class_overlap'),
+        ),
+        migrations.RunSQL(slots_trigger('INSERT'), drop_slots_trigger('INSERT')),
+        migrations.RunSQL(slots_trigger('UPDATE'), drop_slots_trigger('UPDATE')),
+    ]
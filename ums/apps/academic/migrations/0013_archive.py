@@ -0,0 +1,88 @@
+# Generated by Django 5.2.3 on 2026-10-19 16:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from apps.organization.operations import AddAffiliationForeignKey
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academic', '0012_schedule_slot'),
+        ('organization', '0002_program_faculty_unique'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedSchedule',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('course_name', models.CharField(max_length=255)),
+                ('year', models.CharField(max_length=1)),
+                ('mon', models.CharField(blank=True, max_length=13, null=True)),
+                ('tue', models.CharField(blank=True, max_length=13, null=True)),
+                ('wed', models.CharField(blank=True, max_length=13, null=True)),
+                ('thu', models.CharField(blank=True, max_length=13, null=True)),
+                ('fri', models.CharField(blank=True, max_length=13, null=True)),
+                ('sat', models.CharField(blank=True, max_length=13, null=True)),
+                ('sun', models.CharField(blank=True, max_length=13, null=True)),
+                ('archived_at', models.DateTimeField()),
+                ('_class', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='academic.class')),
+                ('course', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='academic.course')),
+                ('faculty', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='organization.faculty')),
+                ('professor', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('program', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='organization.program')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedStudent',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('first_name', models.CharField(max_length=30)),
+                ('last_name', models.CharField(max_length=30)),
+                ('class_name', models.CharField(max_length=255)),
+                ('generation', models.IntegerField()),
+                ('archived_at', models.DateTimeField()),
+                ('_class', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='academic.class')),
+                ('faculty', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='organization.faculty')),
+                ('program', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='organization.program')),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('course_name', models.CharField(max_length=255)),
+                ('year', models.CharField(max_length=1)),
+                ('score', models.IntegerField()),
+                ('course', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='academic.course')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scores', to='academic.archivedstudent')),
+            ],
+            options={
+                'unique_together': {('student', 'course')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedEvaluation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('response', models.JSONField()),
+                ('schedule', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='academic.archivedschedule')),
+                ('student', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='academic.archivedstudent')),
+            ],
+            options={
+                'unique_together': {('schedule', 'student')},
+            },
+        ),
+        AddAffiliationForeignKey('archivedstudent'),
+        AddAffiliationForeignKey('archivedschedule'),
+    ]
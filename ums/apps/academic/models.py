@@ -1,12 +1,41 @@
-from django.db import models
-from django.db.models import Q
-from bulk_update_or_create import BulkUpdateOrCreateQuerySet
+import re
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import Q, F
+from django.db.models.functions import Abs, Cast, NullIf, Power, Sqrt
+from django.contrib.postgres.constraints import ExclusionConstraint
+from django.contrib.postgres.fields import ArrayField, RangeOperators
+from django.contrib.postgres.indexes import GinIndex, GistIndex
+from apps.core.constraints import constraint_errors
 from django_jsonform.models.fields import JSONField
 from apps.organization.mixins import OrganizationMixin
 from apps.users.models import User, Student
 from apps.core.managers import RLSManager
+from .queryset import ScoreQuerySet, ScoreStatsQuerySet, EvaluationQuerySet, ScheduleQuerySet, ScheduleSlotQuerySet, ClassQuerySet, IntRange
 
-class Course(OrganizationMixin):
+def _invalidate_timetables():
+    # the timetables show the schedules with their course and class names
+    from .timetable import invalidate_timetables
+    invalidate_timetables()
+
+class TimetableMixin(models.Model):
+    """
+    Outdates the cached timetables when saved or deleted
+    """
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        _invalidate_timetables()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        _invalidate_timetables()
+        return result
+
+    class Meta:
+        abstract = True
+
+class Course(TimetableMixin, OrganizationMixin):
     name = models.CharField(max_length=255)
     year = models.CharField(max_length=1)
 
@@ -19,10 +48,12 @@ class Course(OrganizationMixin):
     def get_user_rls_filter(self, user):
         return Q(False)
 
-class Class(OrganizationMixin):
+class Class(TimetableMixin, OrganizationMixin):
     generation = models.IntegerField()
     name = models.CharField(max_length=255)
 
+    objects = RLSManager.from_queryset(ClassQuerySet)()
+
     class Meta:
         verbose_name_plural = "Classes"
         unique_together = ('faculty', 'program', 'generation', 'name')
@@ -34,42 +65,180 @@ class Class(OrganizationMixin):
         # the class one is teaching or the class one is a student in
         return Q(students__user=user) | Q(schedule__professor=user)
 
-class Schedule(models.Model):
+# a day of a schedule is a timeslot like 08:00 - 09:30, the database parses it the same way (see the migrations)
+TIMESLOT_RE = re.compile(r'^\s*(\d{1,2})[:.]?(\d{2})\s*-\s*(\d{1,2})[:.]?(\d{2})\s*$')
+WEEKDAYS = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+
+def parse_timeslot(value):
+    """
+    (start, end) in minutes from midnight of a timeslot, None when it isn't one
+    """
+    match = TIMESLOT_RE.match(value or '')
+    if not match:
+        return None
+    start_hour, start_minute, end_hour, end_minute = map(int, match.groups())
+    if start_minute > 59 or end_minute > 59:
+        return None
+    start, end = start_hour * 60 + start_minute, end_hour * 60 + end_minute
+    return (start, end) if start < end <= 24 * 60 else None
+
+def format_timeslot(start, end):
+    """
+    the HH:MM - HH:MM form of a timeslot parsed by parse_timeslot, which fits the day fields
+    """
+    return f'{start // 60:02}:{start % 60:02} - {end // 60:02}:{end % 60:02}'
+
+def validate_timeslot(value):
+    if value and parse_timeslot(value) is None:
+        raise ValidationError(f"{value!r} is not a timeslot like 08:00 - 09:30")
+
+class Schedule(TimetableMixin, models.Model):
     """
     Stores the schedule for a professor for a course for a class
     """
+    OVERLAP_ERRORS = {
+        'professor_overlap': 'The professor already teaches at that time.',
+        'class_overlap': 'The class already has a course at that time.',
+    }
     professor = models.ForeignKey(User, on_delete=models.PROTECT)
     course = models.ForeignKey(Course, on_delete=models.PROTECT)
     _class = models.ForeignKey(Class, on_delete=models.CASCADE, related_name="schedules")
-    mon = models.CharField(max_length=13, null=True, blank=True)
-    tue = models.CharField(max_length=13, null=True, blank=True)
-    wed = models.CharField(max_length=13, null=True, blank=True)
-    thu = models.CharField(max_length=13, null=True, blank=True)
-    fri = models.CharField(max_length=13, null=True, blank=True)
-    sat = models.CharField(max_length=13, null=True, blank=True)
-    sun = models.CharField(max_length=13, null=True, blank=True)
+    mon = models.CharField(max_length=13, null=True, blank=True, validators=[validate_timeslot])
+    tue = models.CharField(max_length=13, null=True, blank=True, validators=[validate_timeslot])
+    wed = models.CharField(max_length=13, null=True, blank=True, validators=[validate_timeslot])
+    thu = models.CharField(max_length=13, null=True, blank=True, validators=[validate_timeslot])
+    fri = models.CharField(max_length=13, null=True, blank=True, validators=[validate_timeslot])
+    sat = models.CharField(max_length=13, null=True, blank=True, validators=[validate_timeslot])
+    sun = models.CharField(max_length=13, null=True, blank=True, validators=[validate_timeslot])
 
-    objects = RLSManager(field_with_affiliation="course")
+    objects = RLSManager.from_queryset(ScheduleQuerySet)(field_with_affiliation="course")
 
     def get_user_rls_filter(self, user):
         return Q(_class__students__user=user) | Q(professor=user)
     
     def __str__(self):
         return f"{self.professor} - {self.course} - {self._class}"
+
+    def save(self, *args, **kwargs):
+        """
+        the slots are written by the database, an overlapping one fails the save with a ValidationError
+        of OVERLAP_ERRORS. callers have to catch it, a form validation can't know about the other rows
+        """
+        with constraint_errors(self.OVERLAP_ERRORS):
+            super().save(*args, **kwargs)
     
     class Meta:
         unique_together = ('professor', 'course', '_class')
+
+class ScheduleSlot(models.Model):
+    """
+    A weekly timeslot of a schedule, one per day field holding a timeslot, in minutes from midnight.
+    triggers write them from the day fields on every insert and update of the schedules, however they are saved,
+    and the slots of a professor or a class can't overlap. days that aren't timeslots have no slot
+    """
+    # the schedules delete their slots in the database (see the migrations)
+    schedule = models.ForeignKey(Schedule, on_delete=models.DO_NOTHING, db_constraint=False, related_name='slots')
+    # copied from the schedule for the overlap constraints
+    professor = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    _class = models.ForeignKey(Class, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    weekday = models.PositiveSmallIntegerField()
+    start = models.PositiveSmallIntegerField()
+    end = models.PositiveSmallIntegerField()
+
+    objects = ScheduleSlotQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{WEEKDAYS[self.weekday]} {self.start // 60:02}:{self.start % 60:02} - {self.end // 60:02}:{self.end % 60:02}"
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(condition=Q(start__lt=F('end'), end__lte=24 * 60, weekday__lt=7),
+                                   name='schedule_slot_valid'),
+            ExclusionConstraint(name='schedule_slot_professor_overlap', expressions=[
+                ('professor', RangeOperators.EQUAL),
+                ('weekday', RangeOperators.EQUAL),
+                (IntRange('start', 'end'), RangeOperators.OVERLAPS),
+            ]),
+            ExclusionConstraint(name='schedule_slot_class_overlap', expressions=[
+                ('_class', RangeOperators.EQUAL),
+                ('weekday', RangeOperators.EQUAL),
+                (IntRange('start', 'end'), RangeOperators.OVERLAPS),
+            ]),
+        ]
+        indexes = [
+            # who is busy at a time, for everyone
+            GistIndex(F('weekday'), IntRange('start', 'end'), name='schedule_slot_time_idx'),
+        ]
     
 class Score(models.Model):
     student = models.ForeignKey(Student, on_delete=models.PROTECT)
     course = models.ForeignKey(Course, on_delete=models.PROTECT)
     score = models.IntegerField(default=0)
+    # bumped by every upsert, the gradebook grid uses it to detect concurrent edits
+    version = models.PositiveIntegerField(default=0)
 
-    objects = BulkUpdateOrCreateQuerySet.as_manager()
+    objects = ScoreQuerySet.as_manager()
 
     class Meta:
         unique_together = ('student', 'course')
 
+def empty_histogram():
+    return [0] * ScoreStats.BUCKETS
+
+def _per_score(field):
+    # averaged over the scores counted, NULL while there are none
+    return Cast(field, models.FloatField()) / NullIf(F('count'), 0)
+
+class ScoreStats(models.Model):
+    """
+    Running aggregates of the scores of a course for a class.
+    kept up to date as a delta by Score.objects.upsert and rebuilt per class by Class.objects.rollover,
+    run `manage.py rebuild_score_stats` after scores were written some other way or students changed class otherwise
+    """
+    BUCKETS = 10
+
+    course = models.ForeignKey(Course, on_delete=models.CASCADE)
+    _class = models.ForeignKey(Class, on_delete=models.CASCADE, related_name="score_stats")
+    count = models.IntegerField(default=0)
+    total = models.BigIntegerField(default=0)
+    total_squares = models.BigIntegerField(default=0)
+    passed = models.IntegerField(default=0)
+    # number of scores per bucket of 10 points, 100 lands in the last one
+    histogram = ArrayField(models.IntegerField(), default=empty_histogram)
+    # derived by postgres on every write so reading them costs nothing
+    mean = models.GeneratedField(
+        expression=Cast(_per_score('total'), models.DecimalField(max_digits=6, decimal_places=2)),
+        output_field=models.DecimalField(max_digits=6, decimal_places=2),
+        db_persist=True,
+    )
+    stddev = models.GeneratedField(
+        expression=Cast(
+            # abs() only absorbs the rounding of a zero variance
+            Sqrt(Abs(_per_score('total_squares') - Power(_per_score('total'), 2))),
+            models.DecimalField(max_digits=6, decimal_places=2),
+        ),
+        output_field=models.DecimalField(max_digits=6, decimal_places=2),
+        db_persist=True,
+    )
+    pass_rate = models.GeneratedField(
+        expression=Cast(_per_score('passed') * 100, models.DecimalField(max_digits=5, decimal_places=2)),
+        output_field=models.DecimalField(max_digits=5, decimal_places=2),
+        db_persist=True,
+    )
+
+    objects = RLSManager.from_queryset(ScoreStatsQuerySet)(field_with_affiliation="course")
+
+    class Meta:
+        verbose_name_plural = "Score statistics"
+        unique_together = ('course', '_class')
+
+    def __str__(self):
+        return f"{self.course} - {self._class}"
+
+    def get_user_rls_filter(self, user):
+        # the classes one teaches the course to
+        return Q(_class__schedules__professor=user, _class__schedules__course=F('course'))
+
 class EvaluationTemplate(models.Model):
     """
     This is a singleton model
@@ -97,23 +266,100 @@ class EvaluationTemplate(models.Model):
             }
         }
     }
+    # the version the compiled evaluation forms were built from, see get_evaluation_form_class.
+    # it expires now and then so a version that was written back out of order can't stay for good
+    VERSION_CACHE_KEY = 'evaluation_template:version'
+    VERSION_CACHE_TIMEOUT = 60 * 5
+
     question_definition = JSONField(schema=TEMPLATE_SCHEMA)
+    # bumped on every save so every worker recompiles the form
+    version = models.PositiveIntegerField(default=0, editable=False)
 
     def save(self, *args, **kwargs):
         self.pk = 1
+        self.version = (EvaluationTemplate.objects.filter(pk=1).values_list('version', flat=True).first() or 0) + 1
         super().save(*args, **kwargs)
+        # overwrite the version instead of deleting it, a request that read the old one from the db
+        # in the meantime only puts it in the cache when there is none (see get_evaluation_form_class)
+        version = self.version
+        transaction.on_commit(lambda: cache.set(self.VERSION_CACHE_KEY, version, self.VERSION_CACHE_TIMEOUT))
 
 class Evaluation(models.Model):
     schedule = models.ForeignKey(Schedule, on_delete=models.CASCADE)
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
     response = models.JSONField()
 
-    objects = RLSManager(field_with_affiliation="schedule.course")
+    objects = RLSManager.from_queryset(EvaluationQuerySet)(field_with_affiliation="schedule.course")
 
     class Meta:
         unique_together = ('schedule', 'student')
+        # the unique index leads with the schedule, this one serves "what did this student evaluate"
+        indexes = [
+            models.Index(fields=['student', 'schedule'], name='evaluation_student_idx'),
+            GinIndex(fields=['response'], opclasses=['jsonb_path_ops'], name='evaluation_response_gin'),
+        ]
 
     def get_user_rls_filter(self, user):
         return Q(schedule__professor=user)
     
-        
\ No newline at end of file
+        
+class ArchivedStudent(OrganizationMixin):
+    """
+    A student of a graduated generation with the names its transcript shows, moved out of the live tables
+    with its scores and evaluations by `manage.py archive_generation`. read only, the user stays
+    """
+    # the ids are the ones the rows had in the live tables
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    first_name = models.CharField(max_length=30)
+    last_name = models.CharField(max_length=30)
+    # the class stays but can be deleted later, its name and generation are kept here
+    _class = models.ForeignKey(Class, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    class_name = models.CharField(max_length=255)
+    generation = models.IntegerField()
+    archived_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.first_name} {self.last_name}"
+
+    def get_user_rls_filter(self, user):
+        return Q(user=user)
+
+class ArchivedScore(models.Model):
+    student = models.ForeignKey(ArchivedStudent, on_delete=models.CASCADE, related_name='scores')
+    course = models.ForeignKey(Course, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    course_name = models.CharField(max_length=255)
+    year = models.CharField(max_length=1)
+    score = models.IntegerField()
+
+    class Meta:
+        unique_together = ('student', 'course')
+
+class ArchivedSchedule(OrganizationMixin):
+    id = models.BigIntegerField(primary_key=True)
+    professor = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    course = models.ForeignKey(Course, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    course_name = models.CharField(max_length=255)
+    year = models.CharField(max_length=1)
+    _class = models.ForeignKey(Class, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    mon = models.CharField(max_length=13, null=True, blank=True)
+    tue = models.CharField(max_length=13, null=True, blank=True)
+    wed = models.CharField(max_length=13, null=True, blank=True)
+    thu = models.CharField(max_length=13, null=True, blank=True)
+    fri = models.CharField(max_length=13, null=True, blank=True)
+    sat = models.CharField(max_length=13, null=True, blank=True)
+    sun = models.CharField(max_length=13, null=True, blank=True)
+    archived_at = models.DateTimeField()
+
+    def get_user_rls_filter(self, user):
+        return Q(professor=user)
+
+class ArchivedEvaluation(models.Model):
+    # a student can be archived before the schedule it evaluated or the other way around,
+    # the ids point to the archive once both are
+    schedule = models.ForeignKey(ArchivedSchedule, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    student = models.ForeignKey(ArchivedStudent, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    response = models.JSONField()
+
+    class Meta:
+        unique_together = ('schedule', 'student')
@@ -0,0 +1,314 @@
+from auditlog.models import LogEntry
+from django.conf import settings
+from django.db import connections, models, transaction
+from django.contrib.postgres.fields import IntegerRangeField
+from django.db.models import Count, Exists, Func, OuterRef
+from django.db.backends.postgresql.psycopg_any import NumericRange
+from apps.core.audit import log_bulk
+from apps.core.queryset import ResponseQuerySet
+
+class ScoreQuerySet(models.QuerySet):
+    def upsert(self, scores, check_version=False, batch_size=500):
+        """
+        Insert or update scores on their (student, course) key with INSERT ... ON CONFLICT DO UPDATE.
+        rows whose score didn't change are left alone and every change bumps the version.
+        with check_version, the version of each given score is the one the caller last saw
+        and the row is only written if nobody changed it since (optimistic concurrency).
+        the rows that exist are locked first so concurrent upserts of a key move the score statistics from the score
+        they actually replace. the statistics are moved in the same transaction, one audit log entry counts the
+        inserted rows and one the updated ones, and the transcripts of the classes involved are invalidated.
+        returns the rows that were actually inserted or changed
+        """
+        # a statement can't touch the same row twice, the last score of a key wins
+        scores = list({(s.student_id, s.course_id): s for s in scores}.values())
+        connection = connections[self.db]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        student = self.model._meta.get_field('student').related_model._meta
+        student_table = connection.ops.quote_name(student.db_table)
+        class_column = connection.ops.quote_name(student.get_field('_class').column)
+        columns = ['id', 'student_id', 'course_id', 'score', 'version']
+        if check_version:
+            # the proposed version is seen + 1, so the row must still be at the version that was seen
+            version = 'EXCLUDED.version'
+            condition = f'AND {table}.version + 1 = EXCLUDED.version'
+        else:
+            version = f'{table}.version + 1'
+            condition = ''
+        changed = []
+        # the rows inserted rather than updated, whose xmax is still 0
+        created = 0
+        stats_changes = []
+
+        with transaction.atomic(using=self.db), connection.cursor() as cursor:
+            for i in range(0, len(scores), batch_size):
+                pending = scores[i:i + batch_size]
+                while pending:
+                    # lock the rows that exist and read their scores, nobody can change them until the commit
+                    # so the statistics move from the score that is actually replaced
+                    cursor.execute(f"""
+                        SELECT s.student_id, s.course_id, s.score FROM {table} s
+                        JOIN (VALUES {', '.join(['(%s, %s)'] * len(pending))}) data (student_id, course_id)
+                        ON data.student_id = s.student_id AND data.course_id = s.course_id
+                        ORDER BY s.id FOR UPDATE OF s
+                    """, [param for s in pending for param in (s.student_id, s.course_id)])
+                    old = {(student_id, course_id): score for student_id, course_id, score in cursor.fetchall()}
+                    values = ', '.join(['(%s, %s, %s, %s, %s)'] * len(pending))
+                    params = [
+                        param for s in pending
+                        for param in (s.student_id, s.course_id, s.score, s.version + 1 if check_version else 1,
+                                      (s.student_id, s.course_id) in old)
+                    ]
+                    # only the locked rows are updated, a row inserted by someone else since is left for another round
+                    cursor.execute(f"""
+                        WITH data (student_id, course_id, score, version, locked) AS (VALUES {values})
+                        INSERT INTO {table} (student_id, course_id, score, version)
+                        SELECT student_id, course_id, score, version FROM data
+                        ON CONFLICT (student_id, course_id) DO UPDATE SET score = EXCLUDED.score, version = {version}
+                        WHERE {table}.score IS DISTINCT FROM EXCLUDED.score {condition}
+                        AND ({table}.student_id, {table}.course_id) IN (SELECT student_id, course_id FROM data WHERE locked)
+                        RETURNING {', '.join(f'{table}.{column}' for column in columns)},
+                            (SELECT {class_column} FROM {student_table} WHERE id = {table}.student_id),
+                            {table}.xmax = 0
+                    """, params)
+                    written = set()
+                    for row in cursor.fetchall():
+                        changed.append(self.model.from_db(self.db, columns, row[:len(columns)]))
+                        _, student_id, course_id, score, _, class_id, inserted = row
+                        created += inserted
+                        written.add((student_id, course_id))
+                        stats_changes.append((course_id, class_id, old.get((student_id, course_id)), score))
+                    pending = [
+                        s for s in pending
+                        if (s.student_id, s.course_id) not in old and (s.student_id, s.course_id) not in written
+                    ]
+
+            self.model._meta.apps.get_model('academic', 'ScoreStats').objects.using(self.db).apply(stats_changes)
+            # the statement writes the rows itself, auditlog gets a summary of them
+            log_bulk(self.model, LogEntry.Action.CREATE, created)
+            log_bulk(self.model, LogEntry.Action.UPDATE, len(changed) - created)
+            # after commit, or a transcript read in between would cache the old scores under the new version
+            from .transcript import invalidate_transcripts
+            class_ids = {class_id for _, class_id, _, _ in stats_changes}
+            transaction.on_commit(lambda: invalidate_transcripts(class_ids), using=self.db)
+        return changed
+
+class ScoreStatsQuerySet(models.QuerySet):
+    def _bucket(self, score):
+        return min(max(score * self.model.BUCKETS // 100, 0), self.model.BUCKETS - 1)
+
+    def apply(self, changes):
+        """
+        Add the score changes to the statistics with a single INSERT ... ON CONFLICT DO UPDATE.
+        changes are (course_id, class_id, old score, new score), a score is None when there was or is no row
+        """
+        pass_mark = settings.SCORE_PASS_MARK
+        deltas = {}
+        for course_id, class_id, old_score, new_score in changes:
+            if class_id is None:
+                # scores of students without a class have nowhere to be counted
+                continue
+            delta = deltas.setdefault((course_id, class_id), [0, 0, 0, 0, [0] * self.model.BUCKETS])
+            for score, sign in ((old_score, -1), (new_score, 1)):
+                if score is None:
+                    continue
+                delta[0] += sign
+                delta[1] += sign * score
+                delta[2] += sign * score * score
+                delta[3] += sign * (score >= pass_mark)
+                delta[4][self._bucket(score)] += sign
+        if not deltas:
+            return
+
+        connection = connections[self.db]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        values = ', '.join(['(%s, %s, %s, %s, %s, %s, %s::integer[])'] * len(deltas))
+        params = [param for key, delta in deltas.items() for param in (*key, *delta)]
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                INSERT INTO {table} (course_id, _class_id, count, total, total_squares, passed, histogram)
+                VALUES {values}
+                ON CONFLICT (course_id, _class_id) DO UPDATE SET
+                    count = {table}.count + EXCLUDED.count,
+                    total = {table}.total + EXCLUDED.total,
+                    total_squares = {table}.total_squares + EXCLUDED.total_squares,
+                    passed = {table}.passed + EXCLUDED.passed,
+                    histogram = ARRAY(
+                        SELECT a + b FROM unnest({table}.histogram, EXCLUDED.histogram) WITH ORDINALITY AS h(a, b, i)
+                        ORDER BY i
+                    )
+            """, params)
+
+    def rebuild(self, class_ids=None):
+        """
+        Recompute every statistic, or those of the classes of class_ids, from the scores in one INSERT ... SELECT.
+        returns the number of (course, class) rows written
+        """
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        table = qn(self.model._meta.db_table)
+        score = self.model._meta.apps.get_model('academic', 'Score')._meta
+        student = score.get_field('student').related_model._meta
+        class_column = qn(student.get_field('_class').column)
+        buckets = self.model.BUCKETS
+        bucket = f'LEAST(GREATEST(sc.score * {buckets} / 100, 0), {buckets - 1})'
+        histogram = ', '.join(f'COUNT(*) FILTER (WHERE {bucket} = {i})' for i in range(buckets))
+
+        with transaction.atomic(using=self.db), connection.cursor() as cursor:
+            # keep score writers out until the new numbers are in, their deltas would be lost otherwise
+            cursor.execute(f'LOCK TABLE {qn(score.db_table)} IN SHARE MODE')
+            if class_ids is None:
+                cursor.execute(f'DELETE FROM {table}')
+                classes, params = '', []
+            else:
+                class_ids = list(class_ids)
+                cursor.execute(f'DELETE FROM {table} WHERE _class_id = ANY(%s::bigint[])', [class_ids])
+                classes, params = f'AND st.{class_column} = ANY(%s::bigint[])', [class_ids]
+            cursor.execute(f"""
+                INSERT INTO {table} (course_id, _class_id, count, total, total_squares, passed, histogram)
+                SELECT sc.course_id, st.{class_column}, COUNT(*), SUM(sc.score), SUM(sc.score::bigint * sc.score),
+                    COUNT(*) FILTER (WHERE sc.score >= %s), ARRAY[{histogram}]
+                FROM {qn(score.db_table)} sc
+                JOIN {qn(student.db_table)} st ON st.id = sc.student_id
+                WHERE st.{class_column} IS NOT NULL {classes}
+                GROUP BY sc.course_id, st.{class_column}
+            """, [settings.SCORE_PASS_MARK, *params])
+            return cursor.rowcount
+
+class EvaluationQuerySet(ResponseQuerySet):
+    def submit(self, schedule_id, user_id, response):
+        """
+        Insert the evaluation of a schedule by the student account of a user in one statement.
+        the student is only found if they are in the class of the schedule and a second
+        submission is dropped by ON CONFLICT DO NOTHING, even when both race.
+        the cached analytics of the schedule are dropped once it commits.
+        returns the id of the new evaluation or None when nothing was inserted
+        """
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        schedule = self.model._meta.get_field('schedule').related_model._meta
+        student = self.model._meta.get_field('student').related_model._meta
+        response = self.model._meta.get_field('response').get_db_prep_value(response, connection)
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                INSERT INTO {qn(self.model._meta.db_table)} (schedule_id, student_id, response)
+                SELECT sch.id, st.id, %s
+                FROM {qn(schedule.db_table)} sch
+                JOIN {qn(student.db_table)} st ON st.{qn(student.get_field('_class').column)} = sch.{qn(schedule.get_field('_class').column)}
+                WHERE sch.id = %s AND st.user_id = %s
+                ON CONFLICT (schedule_id, student_id) DO NOTHING
+                RETURNING id
+            """, [response, schedule_id, user_id])
+            row = cursor.fetchone()
+        if row:
+            from .analytics import invalidate_schedule_analytics
+            transaction.on_commit(lambda: invalidate_schedule_analytics(schedule_id), using=self.db)
+        return row[0] if row else None
+
+class ScheduleQuerySet(models.QuerySet):
+    def _pending_evaluation(self, user):
+        # the user is a student of the schedule's class and has no evaluation of it
+        Evaluation = self.model._meta.apps.get_model('academic', 'Evaluation')
+        Student = Evaluation._meta.get_field('student').related_model
+        in_class = Exists(Student.objects.filter(_class=OuterRef('_class'), user=user))
+        evaluated = Exists(Evaluation.objects.filter(schedule=OuterRef('pk'), student__user=user))
+        return in_class & ~evaluated
+
+    def pending_evaluations(self, user):
+        """
+        The schedules of the user's class that the user didn't evaluate yet, as one anti-join
+        """
+        return self.filter(self._pending_evaluation(user))
+
+    def annotate_pending_evaluation(self, user):
+        """
+        pending_evaluation is true on the schedules the user still has to evaluate as a student
+        """
+        return self.annotate(pending_evaluation=self._pending_evaluation(user))
+
+class IntRange(Func):
+    function = 'int4range'
+    output_field = IntegerRangeField()
+
+class ScheduleSlotQuerySet(models.QuerySet):
+    def overlapping(self, weekday, start, end):
+        """
+        The slots of a weekday that overlap [start, end) minutes, through the (weekday, range) gist index
+        """
+        return self.alias(span=IntRange('start', 'end')).filter(weekday=weekday, span__overlap=NumericRange(start, end))
+
+    def at(self, weekday, minute):
+        """
+        The slots going on at a minute of a weekday, like who teaches at 9:00 on tuesday
+        """
+        return self.overlapping(weekday, minute, minute + 1)
+
+class ClassQuerySet(models.QuerySet):
+    def rollover(self, step=1, dry_run=False):
+        """
+        Move the students of the classes to the class of the same faculty, program and name `step` generations later.
+        the classes missing are created with one bulk_create and the students of each program are moved
+        with one UPDATE ... FROM the (old class, new class) mapping of that program, all in one transaction.
+        the score statistics of the classes involved are rebuilt and their cached transcripts dropped.
+        returns [{'program': id, 'classes': n, 'created': [(generation, name)], 'students': n}] per program,
+        with dry_run nothing is written
+        """
+        sources = {
+            pk: (faculty_id, program_id, generation, name) for pk, faculty_id, program_id, generation, name in
+            self.order_by().distinct().values_list('pk', 'faculty', 'program', 'generation', 'name')
+        }
+        if not sources:
+            return []
+        target_of = {pk: (faculty_id, program_id, generation + step, name)
+                     for pk, (faculty_id, program_id, generation, name) in sources.items()}
+        wanted = set(target_of.values())
+        candidates = self.model.objects.filter(
+            program__in={key[1] for key in wanted},
+            generation__in={key[2] for key in wanted},
+            name__in={key[3] for key in wanted},
+        ).values_list('faculty', 'program', 'generation', 'name', 'pk')
+        targets = {key[:4]: key[4] for key in candidates if key[:4] in wanted}
+        missing = sorted(wanted - set(targets))
+        Student = self.model._meta.get_field('students').related_model
+        students = dict(Student.objects.filter(_class__in=sources).values_list('_class').annotate(n=Count('pk')).order_by())
+
+        plan = {}
+        for pk, (faculty_id, program_id, generation, name) in sources.items():
+            program = plan.setdefault(program_id, {'program': program_id, 'classes': 0, 'created': [], 'students': 0})
+            program['classes'] += 1
+            program['students'] += students.get(pk, 0)
+        for faculty_id, program_id, generation, name in missing:
+            plan[program_id]['created'].append((generation, name))
+        if dry_run:
+            return list(plan.values())
+
+        connection = connections[self.db]
+        with transaction.atomic(using=self.db):
+            if missing:
+                # created concurrently is fine, they are read back with the others
+                self.model.objects.bulk_create([
+                    self.model(faculty_id=faculty_id, program_id=program_id, generation=generation, name=name)
+                    for faculty_id, program_id, generation, name in missing
+                ], ignore_conflicts=True)
+                targets = {key[:4]: key[4] for key in candidates.all() if key[:4] in wanted}
+            table = connection.ops.quote_name(Student._meta.db_table)
+            with connection.cursor() as cursor:
+                for program_id in plan:
+                    old = [pk for pk, key in sources.items() if key[1] == program_id]
+                    # every student is moved from the class it was in before the statement, classes can shift along a chain
+                    cursor.execute(f"""
+                        UPDATE {table} s SET _class_id = m.new_id
+                        FROM unnest(%s::bigint[], %s::bigint[]) AS m (old_id, new_id)
+                        WHERE s._class_id = m.old_id
+                    """, [old, [targets[target_of[pk]] for pk in old]])
+                    plan[program_id]['students'] = cursor.rowcount
+            log_bulk(self.model, LogEntry.Action.CREATE, len(missing))
+            log_bulk(Student, LogEntry.Action.UPDATE, sum(program['students'] for program in plan.values()))
+            # the scores moved with their students, the statistics and ranks of both ends are recounted
+            class_ids = {*sources, *targets.values()}
+            self.model._meta.apps.get_model('academic', 'ScoreStats').objects.using(self.db).rebuild(class_ids)
+            from .transcript import invalidate_transcripts
+            transaction.on_commit(lambda: invalidate_transcripts(class_ids), using=self.db)
+            # the students' own timetables follow their class
+            from .timetable import invalidate_timetables
+            invalidate_timetables()
+        return list(plan.values())
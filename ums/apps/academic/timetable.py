@@ -0,0 +1,121 @@
+import hashlib
+from datetime import date, timedelta
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db import transaction
+from .models import Schedule, WEEKDAYS
+
+# a timetable is the weekly slots of some schedules as seen by a user, cached per user, selected affiliation
+# and timetable. the entries are stamped with the generation they were read at, any write to the schedules,
+# classes or courses bumps the generation which outdates every timetable at once
+GENERATION_KEY = 'timetable:generation'
+FEED_SALT = 'academic.timetable.feed'
+# the recurring events of the feed start on a fixed monday so the feed only changes with the schedules
+FEED_ANCHOR = date(2024, 1, 1)
+
+def timetable_key(request, timetable):
+    """
+    The cache key of a timetable, like professor:<id>, as the request's user sees it with the selected affiliation
+    """
+    s = request.session
+    return f"timetable:{request.user.pk}:{s.get('selected_group')}:{s.get('selected_faculty')}:{s.get('selected_program')}:{timetable}"
+
+def feed_key(user_id):
+    return f'timetable:feed:{user_id}'
+
+def get_timetable(key, queryset):
+    """
+    The slots of the schedules of the queryset, ordered by weekday and start, as dicts with the schedule id,
+    weekday, start and end minutes, their time as text, the course name and the professor and class ids and names.
+    the queryset is only read (with one query) when the timetable isn't cached under the key
+    """
+    generation = cache.get_or_set(GENERATION_KEY, 0, None)
+    cached_generation, entries = cache.get(key, (None, None))
+    if cached_generation != generation:
+        rows = queryset.filter(slots__isnull=False).distinct().values_list(
+            'pk', 'slots__weekday', 'slots__start', 'slots__end', 'course__name',
+            'professor', 'professor__first_name', 'professor__last_name', '_class', '_class__name',
+        ).order_by('slots__weekday', 'slots__start', 'pk')
+        entries = [
+            {'schedule': pk, 'weekday': weekday, 'start': start, 'end': end,
+             'time': f'{start // 60:02}:{start % 60:02} - {end // 60:02}:{end % 60:02}', 'course': course,
+             'professor_id': professor_id, 'professor': f'{first_name} {last_name}', 'class_id': class_id, 'class': class_name}
+            for pk, weekday, start, end, course, professor_id, first_name, last_name, class_id, class_name in rows
+        ]
+        cache.set(key, (generation, entries), settings.TIMETABLE_CACHE_TIMEOUT)
+    return entries
+
+def user_schedules(user, queryset=None):
+    # the schedules the user teaches or is a student of
+    return (queryset if queryset is not None else Schedule.objects.all()).filter(Schedule().get_user_rls_filter(user))
+
+def invalidate_timetables():
+    def bump():
+        try:
+            cache.incr(GENERATION_KEY)
+        except ValueError:
+            pass
+    transaction.on_commit(bump)
+
+def by_weekday(entries):
+    # [(day name, entries of that day)] for the 7 days
+    days = [(day, []) for day in WEEKDAYS]
+    for entry in entries:
+        days[entry['weekday']][1].append(entry)
+    return days
+
+def feed_token(user):
+    return signing.Signer(salt=FEED_SALT).sign(str(user.pk))
+
+def feed_user_id(token):
+    """
+    The id of the user a feed token was made for, None when it isn't a valid token
+    """
+    try:
+        return int(signing.Signer(salt=FEED_SALT).unsign(token))
+    except (signing.BadSignature, ValueError):
+        return None
+
+def etag(entries):
+    return '"' + hashlib.md5(repr(entries).encode()).hexdigest() + '"'
+
+def _escape(text):
+    return str(text).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+def _fold(line):
+    # content lines are at most 75 octets, the rest continues on lines starting with a space
+    encoded = line.encode()
+    while len(encoded) > 75:
+        cut = 75
+        while encoded[cut] & 0xC0 == 0x80:
+            cut -= 1
+        yield encoded[:cut].decode() + '\r\n'
+        encoded = b' ' + encoded[cut:]
+    yield encoded.decode() + '\r\n'
+
+def ics_lines(entries, name, host):
+    """
+    The iCalendar lines of a timetable, a weekly recurring event per slot
+    """
+    stamp = FEED_ANCHOR.strftime('%Y%m%dT000000Z')
+    lines = [
+        'BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//ums//timetable//EN', 'CALSCALE:GREGORIAN',
+        f'X-WR-CALNAME:{_escape(name)}', f'X-WR-TIMEZONE:{settings.TIME_ZONE}',
+    ]
+    yield from (folded for line in lines for folded in _fold(line))
+    for entry in entries:
+        day = (FEED_ANCHOR + timedelta(days=entry['weekday'])).strftime('%Y%m%d')
+        lines = [
+            'BEGIN:VEVENT',
+            f"UID:schedule-{entry['schedule']}-{entry['weekday']}@{host}",
+            f'DTSTAMP:{stamp}',
+            f"DTSTART;TZID={settings.TIME_ZONE}:{day}T{entry['start'] // 60:02}{entry['start'] % 60:02}00",
+            f"DTEND;TZID={settings.TIME_ZONE}:{day}T{entry['end'] // 60:02}{entry['end'] % 60:02}00",
+            'RRULE:FREQ=WEEKLY',
+            f"SUMMARY:{_escape(entry['course'])}",
+            f"DESCRIPTION:{_escape(entry['professor'])} - {_escape(entry['class'])}",
+            'END:VEVENT',
+        ]
+        yield from (folded for line in lines for folded in _fold(line))
+    yield 'END:VCALENDAR\r\n'
@@ -0,0 +1,103 @@
+from django.core.cache import cache
+from django.db import connection
+from apps.users.models import Student
+from .models import ArchivedScore, ArchivedStudent, Course, Score
+
+# ranks also move when a classmate's score changes, so every transcript of a class
+# is keyed on a version of that class which score writes bump
+TIMEOUT = 60 * 60 * 24
+
+def _version_key(class_id):
+    return f'transcript:version:{class_id}'
+
+def get_transcript(student):
+    """
+    The scores of a student with their rank per course and per year in the student's class,
+    as {'courses': [...], 'years': [...]}. cached until a score of the class changes
+    """
+    version = cache.get_or_set(_version_key(student._class_id), 0, None)
+    key = f'transcript:{student._class_id}:{version}:{student.pk}'
+    transcript = cache.get(key)
+    if transcript is None:
+        transcript = _compute_transcript(student)
+        cache.set(key, transcript, TIMEOUT)
+    return transcript
+
+def invalidate_transcripts(class_ids):
+    for class_id in set(class_ids):
+        try:
+            cache.incr(_version_key(class_id))
+        except ValueError:
+            # nobody read a transcript of that class yet
+            pass
+
+def get_archived_transcript(student):
+    """
+    The transcript of an archived student, ranked in its class as it was archived.
+    the archive doesn't change so it is cached as is
+    """
+    key = f'transcript:archive:{student.pk}'
+    transcript = cache.get(key)
+    if transcript is None:
+        qn = connection.ops.quote_name
+        transcript = _ranked_transcript(f"""
+            SELECT sc.student_id, sc.course_id, sc.course_name AS name, sc.year, sc.score
+            FROM {qn(ArchivedScore._meta.db_table)} sc
+            JOIN {qn(ArchivedStudent._meta.db_table)} st ON st.id = sc.student_id
+            WHERE st.{qn(ArchivedStudent._meta.get_field('_class').column)} = %s
+        """, student._class_id, student.pk)
+        cache.set(key, transcript, TIMEOUT)
+    return transcript
+
+def _compute_transcript(student):
+    qn = connection.ops.quote_name
+    class_column = qn(Student._meta.get_field('_class').column)
+    if student._class_id is None:
+        # no classmates to be ranked against
+        scope, scope_param = 'sc.student_id = %s', student.pk
+    else:
+        scope, scope_param = f'st.{class_column} = %s', student._class_id
+    return _ranked_transcript(f"""
+        SELECT sc.student_id, sc.course_id, c.name, c.year, sc.score
+        FROM {qn(Score._meta.db_table)} sc
+        JOIN {qn(Student._meta.db_table)} st ON st.id = sc.student_id
+        JOIN {qn(Course._meta.db_table)} c ON c.id = sc.course_id
+        WHERE {scope}
+    """, scope_param, student.pk)
+
+def _ranked_transcript(scores, scope_param, student_id):
+    """
+    The transcript of a student out of `scores`, a query of the (student_id, course_id, name, year, score)
+    of everyone it is ranked against, which takes scope_param
+    """
+    # rank every course and every year average of the class, then keep the student's rows
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            WITH class_scores AS (
+                SELECT student_id, name, year, score,
+                    RANK() OVER (PARTITION BY course_id ORDER BY score DESC) AS rank,
+                    COUNT(*) OVER (PARTITION BY course_id) AS ranked
+                FROM ({scores}) scores
+            ),
+            years AS (
+                SELECT student_id, year, ROUND(AVG(score), 2) AS average,
+                    RANK() OVER (PARTITION BY year ORDER BY AVG(score) DESC) AS rank,
+                    COUNT(*) OVER (PARTITION BY year) AS ranked
+                FROM class_scores
+                GROUP BY student_id, year
+            )
+            SELECT 'course', name, year, score, rank, ranked FROM class_scores WHERE student_id = %s
+            UNION ALL
+            SELECT 'year', NULL, year, average, rank, ranked FROM years WHERE student_id = %s
+            ORDER BY 3, 2
+        """, [scope_param, student_id, student_id])
+        rows = cursor.fetchall()
+
+    transcript = {'courses': [], 'years': []}
+    for kind, name, year, score, rank, ranked in rows:
+        row = {'year': year, 'score': score, 'rank': rank, 'ranked': ranked}
+        if kind == 'course':
+            transcript['courses'].append({'course': name, **row})
+        else:
+            transcript['years'].append(row)
+    return transcript
@@ -14,13 +14,25 @@ urlpatterns = [
     path('classes/create/', views.ClassCreateView.as_view(), name='add_class'),
     path('classes/change/<int:pk>/', views.ClassUpdateView.as_view(), name='change_class'),
     path('classes/delete/<int:pk>/', views.ClassDeleteView.as_view(), name='delete_class'),
+    path('classes/rollover/', views.ClassRolloverView.as_view(), name='rollover_class'),
     # schedule
     path('schedules/', views.ScheduleListView.as_view(), name='view_schedule'),
+    path('schedules/pending-evaluations/', views.PendingEvaluationListView.as_view(), name='pending_evaluation'),
+    path('schedules/import/', views.ScheduleImportView.as_view(), name='import_schedule'),
+    path('schedules/timetable/', views.TimetableView.as_view(), name='view_timetable'),
+    path('schedules/timetable/professor/<int:professor>/', views.TimetableView.as_view(), name='view_timetable_professor'),
+    path('schedules/timetable/class/<int:class>/', views.TimetableView.as_view(), name='view_timetable_class'),
+    path('schedules/timetable/<str:token>.ics', views.timetable_feed, name='timetable_feed'),
     # score
     path('scores/<int:student_pk>', views.ScoreStudentListView.as_view(), name='view_score'),
     path('scores/add/<int:schedule_pk>/', views.ScoreScheduleCreateView.as_view(), name='add_score'),
+    path('scores/stats/', views.ScoreStatsListView.as_view(), name='view_scorestats'),
+    # archive
+    path('archive/students/', views.ArchivedStudentListView.as_view(), name='view_archivedstudent'),
+    path('archive/transcripts/<int:student_pk>/', views.ArchivedTranscriptView.as_view(), name='view_archived_transcript'),
     # evaluation
     path('evaluations/', views.EvaluationListView.as_view(), name='view_evaluation'),
+    path('evaluations/analytics/', views.EvaluationAnalyticsView.as_view(), name='view_evaluation_analytics'),
     path('evaluations/add/<int:schedule_pk>/', views.EvaluationCreateView.as_view(), name='add_evaluation'),
     path('evaluations/delete/', views.EvaluationBulkDeleteView.as_view(), name='delete_evaluation')
 ]
@@ -1,12 +1,23 @@
-from django.urls import reverse_lazy
+import json
+from django.urls import reverse, reverse_lazy
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import condition
+from django.shortcuts import redirect, render
 from django.core.exceptions import ValidationError
-from django.forms.models import modelform_factory
-from django_jsonform.widgets import JSONFormWidget
+from django.db import IntegrityError
+from django.contrib import messages
 from extra_views import InlineFormSetView
-from apps.core.views import BaseListView, BaseCreateView, BaseUpdateView, BaseDeleteView, BaseBulkDeleteView, BaseWriteView
-from apps.core.forms import json_to_schema
-from .models import Course, Class, Schedule, Score, Evaluation, EvaluationTemplate
-from .forms import create_score_form_class, ScheduleForm
+from apps.core.spreadsheet import read_rows
+from apps.core.views import BaseListView, BaseCreateView, BaseUpdateView, BaseDeleteView, BaseBulkDeleteView, BaseWriteView, ResponseFilterMixin
+from apps.organization.models import Program
+from apps.users.models import Student, User
+from .models import Course, Class, Schedule, Score, ScoreStats, Evaluation, EvaluationTemplate, ArchivedScore, ArchivedStudent
+from .forms import ClassRolloverForm, ScheduleForm, ScheduleFormSet, ScheduleImportForm, get_evaluation_form_class
+from .imports import import_schedules
+from .transcript import get_archived_transcript, get_transcript
+from .analytics import get_schedule_analytics, combine, invalidate_all_analytics
+from .timetable import (by_weekday, etag, feed_key, feed_token, feed_user_id, get_timetable, ics_lines,
+                        timetable_key, user_schedules)
 
 class CourseListView(BaseListView):
     model = Course
@@ -28,36 +39,301 @@ class ScheduleListView(BaseListView):
     model = Schedule
     object_actions = [('score', 'academic:add_score', None),
                ('evaluation', 'academic:add_evaluation', None)]
+    actions = [('to evaluate', 'academic:pending_evaluation', 'add_evaluation'),
+               ('timetable', 'academic:view_timetable', 'view_schedule'),
+               ('import', 'academic:import_schedule', 'add_schedule')]
     table_fields = ['professor', 'course', 'course.year', '_class']
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if 'add_evaluation' in self.request.session['permissions']:
+            queryset = queryset.annotate_pending_evaluation(self.request.user)
+        return queryset
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        if 'add_evaluation' in self.request.session['permissions']:
+            context['table_fields'] = self.table_fields + ['pending_evaluation']
+        return context
+
+class ScheduleImportView(BaseWriteView):
+    """
+    Create the schedules of a .csv or .xlsx sheet in the selected affiliation, all of them or none
+    """
+    model = Schedule
+    form_class = ScheduleImportForm
+    permission_required = [('add', None)]
+    # the first errors are enough to fix the sheet
+    MAX_ERRORS = 50
+
+    def form_valid(self, form):
+        try:
+            rows = read_rows(form.cleaned_data['file'])
+        except ValueError as e:
+            form.add_error('file', str(e))
+            return self.form_invalid(form)
+        try:
+            created, errors = import_schedules(self.request, rows)
+        except ValidationError as e:
+            form.add_error(None, e)
+            return self.form_invalid(form)
+        except IntegrityError:
+            form.add_error(None, 'a schedule of the sheet was just saved by someone else, import it again')
+            return self.form_invalid(form)
+        if errors:
+            for number, error in errors[:self.MAX_ERRORS]:
+                form.add_error(None, f'row {number}: {error}')
+            if len(errors) > self.MAX_ERRORS:
+                form.add_error(None, f'and {len(errors) - self.MAX_ERRORS} more')
+            return self.form_invalid(form)
+        messages.success(self.request, f'{len(created)} schedules imported')
+        return redirect(self.get_success_url())
+
+class TimetableView(BaseListView):
+    """
+    The weekly timetable of the user as a professor and a student, of a professor or of a class,
+    read with one query and cached until the schedules change
+    """
+    model = Schedule
+    template_name = 'academic/timetable.html'
+
+    def get_queryset(self):
+        queryset = Schedule.objects.get_queryset(request=self.request)
+        # only the professors and classes one can see, or their names could be read off by id
+        if professor_id := self.kwargs.get('professor'):
+            self.title = User.objects.get_queryset(request=self.request).filter(pk=professor_id).first()
+            timetable, queryset = f'professor:{professor_id}', queryset.filter(professor=professor_id)
+        elif class_id := self.kwargs.get('class'):
+            self.title = Class.objects.get_queryset(request=self.request).filter(pk=class_id).first()
+            timetable, queryset = f'class:{class_id}', queryset.filter(_class=class_id)
+        else:
+            self.title = 'my timetable'
+            timetable, queryset = 'user', user_schedules(self.request.user, queryset)
+        if self.title is None:
+            raise Http404
+        return get_timetable(timetable_key(self.request, timetable), queryset)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['title'] = self.title
+        context['days'] = by_weekday(self.object_list)
+        if not self.kwargs:
+            token = feed_token(self.request.user)
+            context['feed_url'] = self.request.build_absolute_uri(reverse('academic:timetable_feed', args=[token]))
+        return context
+
+def _feed_timetable(request, token):
+    # read once for both the etag and the response
+    if not hasattr(request, 'timetable'):
+        user_id = feed_user_id(token)
+        if user_id is None or not User.objects.filter(pk=user_id, is_active=True).exists():
+            raise Http404
+        request.timetable = get_timetable(feed_key(user_id), user_schedules(User(pk=user_id)))
+    return request.timetable
+
+@condition(etag_func=lambda request, token: etag(_feed_timetable(request, token)))
+def timetable_feed(request, token):
+    """
+    The user's timetable as an iCalendar feed for calendar apps, which have no session so the user is in the
+    signed token of the url. the etag lets them poll with If-None-Match and get a 304 while nothing changed
+    """
+    response = StreamingHttpResponse(
+        ics_lines(_feed_timetable(request, token), 'timetable', request.get_host()),
+        content_type='text/calendar; charset=utf-8',
+    )
+    response['Content-Disposition'] = 'inline; filename="timetable.ics"'
+    return response
+
+class PendingEvaluationListView(BaseListView):
+    """
+    The schedules the student still has to evaluate
+    """
+    model = Schedule
+    object_actions = [('evaluation', 'academic:add_evaluation', None)]
+    table_fields = ['professor', 'course', 'course.year', '_class']
+
+    def get_queryset(self):
+        return Schedule.objects.pending_evaluations(self.request.user).select_related('professor', 'course', '_class')
+
 class ScoreStudentListView(BaseListView):
+    """
+    Transcript of a student: the scores with their rank in the class and the year averages
+    """
     model = Score
-    table_fields = ['course', 'score']
+    template_name = 'academic/transcript.html'
+
+    def get_queryset(self):
+        self.student = Student.objects.get_queryset(request=self.request).select_related('user', '_class') \
+            .filter(pk=self.kwargs['student_pk']).first()
+        if not self.student:
+            raise Http404("Student not found")
+        self.transcript = get_transcript(self.student)
+        return self.transcript['courses']
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['title'] = f'{self.student} - {self.student._class}' if self.student._class else str(self.student)
+        context['years'] = self.transcript['years']
+        return context
+
+class ArchivedStudentListView(BaseListView):
+    """
+    The students of the archived generations, read only
+    """
+    model = ArchivedStudent
+    object_actions = [('transcript', 'academic:view_archived_transcript', 'view_archivedscore')]
+    table_fields = ['first_name', 'last_name', 'generation', 'class_name', 'archived_at']
+
+    def get_queryset(self):
+        return super().get_queryset().order_by('-generation', 'class_name', 'last_name', 'first_name')
+
+class ArchivedTranscriptView(BaseListView):
+    """
+    Transcript of an archived student, ranked in its class as it was archived
+    """
+    model = ArchivedScore
+    template_name = 'academic/transcript.html'
 
     def get_queryset(self):
-        return Score.objects.filter(student_id=self.kwargs['student_pk']).select_related('course')
+        self.student = ArchivedStudent.objects.get_queryset(request=self.request).filter(pk=self.kwargs['student_pk']).first()
+        if not self.student:
+            raise Http404("Student not found")
+        self.transcript = get_archived_transcript(self.student)
+        return self.transcript['courses']
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['title'] = f'{self.student} - {self.student.generation} {self.student.class_name} (archived)'
+        context['years'] = self.transcript['years']
+        return context
+
+class ScoreStatsListView(BaseListView):
+    model = ScoreStats
+    table_fields = ['course', '_class', 'count', 'mean', 'stddev', 'pass_rate', 'histogram']
 
 class ScoreScheduleCreateView(BaseWriteView):
     """
-    View for bulk creating/updating scores for all students in a class.
+    Gradebook of a schedule. the page loads the roster and scores as json
+    and saves the edited cells in small PATCH batches, each cell guarded by its version
     """
     model = Score
     permission_required = [('add', 'score')]
-    template_name = 'core/generic_form.html'
+    template_name = 'academic/score_grid.html'
     success_url = reverse_lazy('academic:view_schedule')
+    http_method_names = ['get', 'patch']
 
-    def get_form_class(self):
-        Form = create_score_form_class(schedule_pk=self.kwargs['schedule_pk'])
-        return Form
-    
-    def form_valid(self, form):
-        form.save()
-        return super().form_valid(form)
+    def get_schedule(self):
+        schedule = Schedule.objects.get_queryset(request=self.request).select_related('course', '_class') \
+            .filter(pk=self.kwargs['schedule_pk']).distinct().first()
+        if not schedule:
+            raise Http404("Schedule not found")
+        return schedule
+
+    def get(self, request, *args, **kwargs):
+        schedule = self.get_schedule()
+        if request.GET.get('format') != 'json':
+            return render(request, self.template_name, {
+                'title': f'scores of {schedule.course} for {schedule._class}',
+                'cancel_url': self.get_success_url(),
+            })
+
+        students = Student.objects.filter(_class=schedule._class_id) \
+            .order_by('user__first_name', 'user__last_name') \
+            .values_list('id', 'user__first_name', 'user__last_name')
+        scores = {
+            student_id: (score, version) for student_id, score, version in
+            Score.objects.filter(course=schedule.course_id, student___class=schedule._class_id)
+            .values_list('student_id', 'score', 'version')
+        }
+        # [student id, name, score, version], a missing score is null at version 0
+        return JsonResponse({'rows': [
+            [pk, f'{first_name} {last_name}', *scores.get(pk, (None, 0))]
+            for pk, first_name, last_name in students
+        ]})
 
-class EvaluationListView(BaseListView):
+    def patch(self, request, *args, **kwargs):
+        """
+        body: {"cells": [[student id, score, version seen], ...]}
+        answers the cells that were saved and, for those that were edited by someone else
+        in the meantime, the current score and version
+        """
+        schedule = self.get_schedule()
+        try:
+            cells = [(int(pk), int(score), int(version)) for pk, score, version in json.loads(request.body)['cells']]
+        except (ValueError, TypeError, KeyError):
+            return JsonResponse({'error': 'malformed cells'}, status=400)
+        if any(not 0 <= score <= 100 for _, score, _ in cells):
+            return JsonResponse({'error': 'scores must be between 0 and 100'}, status=400)
+        roster = set(Student.objects.filter(_class=schedule._class_id, pk__in=[pk for pk, _, _ in cells])
+                     .values_list('pk', flat=True))
+        if len(roster) != len({pk for pk, _, _ in cells}):
+            return JsonResponse({'error': 'student is not in this class'}, status=400)
+
+        saved = Score.objects.upsert([
+            Score(student_id=pk, course_id=schedule.course_id, score=score, version=version)
+            for pk, score, version in cells
+        ], check_version=True)
+        saved_pks = {score.student_id for score in saved}
+
+        # cells that weren't written either didn't change or lost the race
+        seen = {pk: version for pk, _, version in cells if pk not in saved_pks}
+        conflicts = [
+            [pk, score, version] for pk, score, version in
+            Score.objects.filter(course=schedule.course_id, student__in=seen)
+            .values_list('student_id', 'score', 'version')
+            if seen[pk] != version
+        ]
+        return JsonResponse({
+            'saved': [[score.student_id, score.score, score.version] for score in saved],
+            'conflicts': conflicts,
+        })
+
+class EvaluationListView(ResponseFilterMixin, BaseListView):
+    """
+    the answers can be filtered on with ?response.<title>=
+    """
     model = Evaluation
     table_fields = ['schedule.course', 'schedule._class', 'schedule.professor', 'response']
-    actions = [('clear all', 'academic:delete_evaluation', None)]
+    actions = [('clear all', 'academic:delete_evaluation', None),
+               ('analytics', 'academic:view_evaluation_analytics', 'view_evaluation')]
+
+    def get_response_questions(self):
+        return EvaluationTemplate.objects.values_list('question_definition', flat=True).get()
+
+class EvaluationAnalyticsView(BaseListView):
+    """
+    The answers of the evaluations one can see, added up per schedule, course or professor (?by=).
+    averages for the numeric questions and answer counts for the dropdowns and checkboxes
+    """
+    model = Evaluation
+    template_name = 'academic/evaluation_analytics.html'
+    groupings = {
+        'schedule': lambda schedule: schedule,
+        'course': lambda schedule: schedule.course,
+        'professor': lambda schedule: schedule.professor,
+    }
+
+    def get_queryset(self):
+        self.by = self.request.GET.get('by')
+        if self.by not in self.groupings:
+            self.by = 'schedule'
+        schedules = Schedule.objects \
+            .filter(pk__in=Evaluation.objects.get_queryset(request=self.request).values('schedule')) \
+            .select_related('course', 'professor', '_class')
+        analytics = get_schedule_analytics([schedule.pk for schedule in schedules])
+        groups = {}
+        for schedule in schedules:
+            groups.setdefault(self.groupings[self.by](schedule), []).append(analytics[schedule.pk])
+        return sorted(
+            ({'name': str(group), **combine(data)} for group, data in groups.items()),
+            key=lambda group: group['name'],
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['by'] = self.by
+        context['groupings'] = list(self.groupings)
+        return context
 
 class EvaluationCreateView(BaseWriteView):
     """
@@ -66,26 +342,23 @@ class EvaluationCreateView(BaseWriteView):
     model = Evaluation
     success_url = reverse_lazy('academic:view_schedule')
 
-    # throw an error if they've already created the evaluation
-    def dispatch(self, request, *args, **kwargs):
+    # throw an error if they've already created the evaluation, a POST finds out from the insert itself
+    def get(self, request, *args, **kwargs):
         if Evaluation.objects.filter(schedule=kwargs['schedule_pk'], student__user=request.user).exists():
             raise ValidationError(f"You've already evaluated this schedule {kwargs['schedule_pk']}")
-        return super().dispatch(request, *args, **kwargs)
+        return super().get(request, *args, **kwargs)
 
     def get_form(self):
-        question_definition = EvaluationTemplate.objects.get().question_definition
-        Form = modelform_factory(Evaluation, fields=['response'], widgets={
-            'response': JSONFormWidget(schema=json_to_schema(question_definition))
-            })
-        return super().get_form(form_class=Form)
+        return super().get_form(form_class=get_evaluation_form_class())
     
     def form_valid(self, form):
-        Evaluation.objects.create(
-            schedule=Schedule.objects.get(pk=self.kwargs['schedule_pk']), 
-            student=self.request.user.student, 
-            response=form.cleaned_data['response']
-            )
-        return super().form_valid(form)
+        schedule_pk = self.kwargs['schedule_pk']
+        if not Evaluation.objects.submit(schedule_pk, self.request.user.pk, form.cleaned_data['response']):
+            if Evaluation.objects.filter(schedule=schedule_pk, student__user=self.request.user).exists():
+                raise ValidationError(f"You've already evaluated this schedule {schedule_pk}")
+            raise Http404("You are not a student of this schedule")
+        # nothing to inject, the evaluation is already in
+        return redirect(self.get_success_url())
 
 class EvaluationBulkDeleteView(BaseBulkDeleteView):
     """
@@ -93,11 +366,19 @@ class EvaluationBulkDeleteView(BaseBulkDeleteView):
     """
     model = Evaluation
 
+    def post(self, request, *args, **kwargs):
+        response = super().post(request, *args, **kwargs)
+        invalidate_all_analytics()
+        return response
+
 class ClassListView(BaseListView):
     model = Class
     object_actions = [('✏️', 'academic:change_class', None),
-               ('🗑️', 'academic:delete_class', None)]
-    actions = [('+', 'academic:add_class', None)]
+               ('🗑️', 'academic:delete_class', None),
+               ('timetable', 'academic:view_timetable_class', 'view_schedule')]
+    actions = [('+', 'academic:add_class', None),
+               ('rollover', 'academic:rollover_class', 'change_class'),
+               ('archive', 'academic:view_archivedstudent', 'view_archivedstudent')]
     table_fields = ['generation', 'name']
 
 class ClassDeleteView(BaseDeleteView):
@@ -106,12 +387,40 @@ class ClassDeleteView(BaseDeleteView):
 class ClassCreateView(BaseCreateView):
     model = Class
 
-class ClassUpdateView(BaseWriteView, InlineFormSetView):
+class ClassRolloverView(BaseWriteView):
+    """
+    Move the students of a generation's classes to the classes of a later generation, creating them when missing.
+    preview shows what would change without writing anything
+    """
+    model = Class
+    form_class = ClassRolloverForm
+    permission_required = [('change', None)]
+    template_name = 'academic/class_rollover.html'
+
+    def form_valid(self, form):
+        dry_run = 'preview' in self.request.POST
+        classes = Class.objects.get_queryset(request=self.request).filter(generation=form.cleaned_data['generation'])
+        plan = classes.rollover(step=form.cleaned_data['step'], dry_run=dry_run)
+        if dry_run:
+            names = dict(Program.objects.filter(pk__in=[program['program'] for program in plan]).values_list('pk', 'name'))
+            for program in plan:
+                program['name'] = names.get(program['program'])
+            return self.render_to_response(self.get_context_data(form=form, plan=plan))
+        messages.success(self.request, f"{sum(program['students'] for program in plan)} students moved, "
+                                       f"{sum(len(program['created']) for program in plan)} classes created")
+        return redirect(self.get_success_url())
+
+class ClassUpdateView(InlineFormSetView, BaseWriteView):
+    """
+    Edit the schedules of a class as an inline formset.
+    the formset view goes first so that get/post handle the formset and not a single form
+    """
     model = Class
     inline_model = Schedule
     form_class = ScheduleForm
+    formset_class = ScheduleFormSet
     factory_kwargs = {'extra': 1, 'can_delete': True}
-    fields = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun', 'course', '_class']     
+    fields = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun', 'course', 'professor', '_class']
     success_url = reverse_lazy('academic:view_class')
     template_name = 'core/generic_form.html'
     permission_required = [('change', None)]
@@ -120,11 +429,17 @@ class ClassUpdateView(BaseWriteView, InlineFormSetView):
         kwargs = super().get_form_kwargs()
         kwargs['request'] = self.request
         return kwargs
-    
+
     def formset_valid(self, formset):
-        for data in formset.cleaned_data:
-            if data.get('DELETE') == True:
-                Schedule.objects.get(
-                    course=data['course'], _class=data['_class'], professor=data['professor']
-                ).delete()
-        return super().formset_valid(formset)
+        # a professor or the class being double booked is only found by the database as the rows are written
+        try:
+            return super().formset_valid(formset)
+        except ValidationError as e:
+            formset.non_form_errors().extend(e.messages)
+            return self.formset_invalid(formset)
+
+    def get_context_data(self, **kwargs):
+        # the formset is the only form on this page
+        kwargs.setdefault('form', None)
+        return super().get_context_data(**kwargs)
+
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from apps.core.partitioning import rotate_partitions
+from apps.activities.models import Activity, ActivityAnswer
+
+class Command(BaseCommand):
+    help = 'Create the monthly activity partitions ahead of time and drop (or detach) the ones past retention'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=3, help='months to create partitions for, this one included')
+        parser.add_argument('--keep', type=int, default=settings.ACTIVITY_RETENTION_MONTHS,
+                            help='months of activities to keep, this one included, none keeps every month')
+        parser.add_argument('--detach', action='store_true', help='detach the old partitions instead of dropping them')
+
+    def handle(self, *args, **options):
+        qn = connection.ops.quote_name
+
+        def delete_answers(partition):
+            # the trigger doesn't see rows leaving with their partition
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {qn(ActivityAnswer._meta.db_table)} '
+                               f'WHERE activity_id IN (SELECT id FROM {qn(partition)})')
+
+        for action, name in rotate_partitions(Activity._meta.db_table, 'created_at', options['ahead'],
+                                              options['keep'], options['detach'], delete_answers):
+            self.stdout.write(f'{action} {name}')
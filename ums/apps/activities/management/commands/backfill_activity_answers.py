@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from apps.activities.models import ActivityAnswer, ActivityTemplate
+
+class Command(BaseCommand):
+    help = 'Project the answers of the activities of templates with typed answers into ActivityAnswer again'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--template', type=int, help='only this template')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        templates = ActivityTemplate.objects.all()
+        if options['template']:
+            templates = templates.filter(pk=options['template'])
+        for template in templates:
+            rows = ActivityAnswer.objects.rebuild(template, chunk_size=options['chunk_size'])
+            if template.typed_answers:
+                self.stdout.write(f'wrote {rows} typed answers of {template}')
+        self.stdout.write(self.style.SUCCESS('Typed answers are up to date'))
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from apps.activities.models import ActivityRollup
+
+class Command(BaseCommand):
+    help = 'Recount the activities per faculty, program, template and day, the days of dropped partitions are lost'
+
+    def handle(self, *args, **options):
+        rows = ActivityRollup.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} activity rollups'))
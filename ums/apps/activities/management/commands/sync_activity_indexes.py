@@ -0,0 +1,23 @@
+from django.db import connection
+from django.core.management.base import BaseCommand
+from apps.activities.models import Activity, ActivityTemplate, sync_response_indexes
+
+class Command(BaseCommand):
+    help = 'Create or drop the answer indexes of every activity template to match its filterable questions'
+
+    def handle(self, *args, **options):
+        templates = set()
+        for template in ActivityTemplate.objects.all():
+            sync_response_indexes(template.pk, template.template_definition)
+            templates.add(template.pk)
+            self.stdout.write(f'synced the indexes of {template}')
+        # the indexes of the templates that were deleted since, named activity_response_<template pk>_<question>
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT indexname FROM pg_indexes WHERE tablename = %s AND starts_with(indexname, 'activity_response_')",
+                [Activity._meta.db_table],
+            )
+            indexed = {int(pk) for name, in cursor.fetchall() if (pk := name.split('_')[2]).isdigit()}
+        for pk in indexed - templates:
+            sync_response_indexes(pk, [])
+            self.stdout.write(f'dropped the indexes of deleted template {pk}')
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.3 on 2026-10-19 16:30
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # built without locking out the writes to a big table
+    atomic = False
+
+    dependencies = [
+        ('activities', '0002_initial'),
+        ('organization', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='activity',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['response'], name='activity_response_gin', opclasses=['jsonb_path_ops']),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.3 on 2026-10-19 16:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0003_response_gin'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activitytemplate',
+            name='typed_answers',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='ActivityAnswer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('question', models.CharField(max_length=255)),
+                ('number', models.FloatField(null=True)),
+                ('date', models.DateField(null=True)),
+                ('datetime', models.DateTimeField(null=True)),
+                ('time', models.TimeField(null=True)),
+                ('choice', models.CharField(max_length=255, null=True)),
+                ('text', models.TextField(null=True)),
+                ('activity', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='answers', to='activities.activity')),
+                ('template', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='activities.activitytemplate')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('number__isnull', False)), fields=['template', 'question', 'number'], name='activity_answer_number_idx'), models.Index(condition=models.Q(('date__isnull', False)), fields=['template', 'question', 'date'], name='activity_answer_date_idx'), models.Index(condition=models.Q(('datetime__isnull', False)), fields=['template', 'question', 'datetime'], name='activity_answer_datetime_idx'), models.Index(condition=models.Q(('time__isnull', False)), fields=['template', 'question', 'time'], name='activity_answer_time_idx'), models.Index(condition=models.Q(('choice__isnull', False)), fields=['template', 'question', 'choice'], name='activity_answer_choice_idx')],
+            },
+        ),
+        # postgres deletes the answers with their activity, django leaves the relation alone (DO_NOTHING)
+        migrations.RunSQL(
+            'ALTER TABLE activities_activityanswer ADD CONSTRAINT activities_activityanswer_activity_fk '
+            'FOREIGN KEY (activity_id) REFERENCES activities_activity (id) ON DELETE CASCADE',
+            'ALTER TABLE activities_activityanswer DROP CONSTRAINT activities_activityanswer_activity_fk',
+        ),
+    ]
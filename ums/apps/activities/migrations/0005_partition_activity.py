@@ -0,0 +1,34 @@
+from django.db import migrations
+from apps.core.partitioning import PartitionByMonth
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0004_typed_answers'),
+    ]
+
+    operations = [
+        # a partitioned table can only be referenced on (id, created_at), the answers are deleted by a trigger instead
+        migrations.RunSQL(
+            'ALTER TABLE activities_activityanswer DROP CONSTRAINT activities_activityanswer_activity_fk',
+            'ALTER TABLE activities_activityanswer ADD CONSTRAINT activities_activityanswer_activity_fk '
+            'FOREIGN KEY (activity_id) REFERENCES activities_activity (id) ON DELETE CASCADE',
+        ),
+        PartitionByMonth('activity', 'created_at', ahead=3),
+        migrations.RunSQL(
+            """
+            CREATE FUNCTION activities_delete_answers() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                DELETE FROM activities_activityanswer WHERE activity_id IN (SELECT id FROM deleted);
+                RETURN NULL;
+            END $$;
+            CREATE TRIGGER activities_delete_answers AFTER DELETE ON activities_activity
+            REFERENCING OLD TABLE AS deleted FOR EACH STATEMENT EXECUTE FUNCTION activities_delete_answers();
+            """,
+            """
+            DROP TRIGGER activities_delete_answers ON activities_activity;
+            DROP FUNCTION activities_delete_answers();
+            """,
+        ),
+    ]
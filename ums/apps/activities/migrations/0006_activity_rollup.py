@@ -0,0 +1,76 @@
+# Generated by Django 5.2.3 on 2026-10-19 16:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def rollup_trigger(operation, delta):
+    # the rows of the statement are added up per key, a moved row cancels itself out of its old key.
+    # the day is taken in the TIME_ZONE of when this migration ran, it is written into the functions.
+    # after changing TIME_ZONE the triggers have to be created again by a new migration and the rollups rebuilt
+    return f"""
+        CREATE FUNCTION activities_rollup_{operation.lower()}() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            INSERT INTO activities_activityrollup AS r (faculty_id, program_id, template_id, day, count)
+            SELECT faculty_id, program_id, template_id, (created_at AT TIME ZONE '{settings.TIME_ZONE}')::date, SUM(n)
+            FROM ({delta}) delta
+            GROUP BY 1, 2, 3, 4 HAVING SUM(n) <> 0
+            ON CONFLICT (faculty_id, program_id, template_id, day) DO UPDATE SET count = r.count + EXCLUDED.count;
+            DELETE FROM activities_activityrollup WHERE count = 0;
+            RETURN NULL;
+        END $$;
+        CREATE TRIGGER activities_rollup_{operation.lower()} AFTER {operation} ON activities_activity
+        REFERENCING {' '.join(f'{table.upper()} TABLE AS {table}_rows' for table in ('old', 'new') if f'{table}_rows' in delta)}
+        FOR EACH STATEMENT EXECUTE FUNCTION activities_rollup_{operation.lower()}();
+    """
+
+
+def drop_rollup_trigger(operation):
+    return f"""
+        DROP TRIGGER activities_rollup_{operation.lower()} ON activities_activity;
+        DROP FUNCTION activities_rollup_{operation.lower()}();
+    """
+
+
+NEW = 'SELECT faculty_id, program_id, template_id, created_at, 1 AS n FROM new_rows'
+OLD = 'SELECT faculty_id, program_id, template_id, created_at, -1 AS n FROM old_rows'
+
+
+# count the activities that exist from before the rollups did.
+# the same numbers as ActivityRollup.objects.rebuild, frozen here as the models may change
+REBUILD_ACTIVITY_ROLLUPS = """
+    INSERT INTO activities_activityrollup (faculty_id, program_id, template_id, day, count)
+    SELECT faculty_id, program_id, template_id, (created_at AT TIME ZONE %s)::date, COUNT(*)
+    FROM activities_activity GROUP BY 1, 2, 3, 4
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0005_partition_activity'),
+        ('organization', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('count', models.IntegerField(default=0)),
+                ('faculty', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='organization.faculty')),
+                ('program', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='organization.program')),
+                ('template', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='activities.activitytemplate')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['faculty', 'program', 'day'], name='activity_rollup_day_idx'), models.Index(condition=models.Q(('count', 0)), fields=['id'], name='activity_rollup_zero_idx')],
+                'constraints': [models.UniqueConstraint(fields=('faculty', 'program', 'template', 'day'), name='activity_rollup_unique', nulls_distinct=False)],
+            },
+        ),
+        migrations.RunSQL(rollup_trigger('INSERT', NEW), drop_rollup_trigger('INSERT')),
+        migrations.RunSQL(rollup_trigger('DELETE', OLD), drop_rollup_trigger('DELETE')),
+        migrations.RunSQL(rollup_trigger('UPDATE', f'{OLD} UNION ALL {NEW}'), drop_rollup_trigger('UPDATE')),
+        migrations.RunSQL([(REBUILD_ACTIVITY_ROLLUPS, [settings.TIME_ZONE])], migrations.RunSQL.noop),
+    ]
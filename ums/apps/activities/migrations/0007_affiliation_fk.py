@@ -0,0 +1,14 @@
+from django.db import migrations
+from apps.organization.operations import AddAffiliationForeignKey
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0006_activity_rollup'),
+        ('organization', '0002_program_faculty_unique'),
+    ]
+
+    operations = [
+        AddAffiliationForeignKey('activity'),
+    ]
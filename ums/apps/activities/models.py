@@ -1,8 +1,15 @@
-from django.db import models
+from hashlib import md5
+from django.db import connection, models, transaction
 from django.db.models import Q
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
 from django_jsonform.models.fields import JSONField
 from apps.organization.mixins import OrganizationNullMixin
+from apps.core.managers import RLSManager
+from apps.core.queryset import RANGE_TYPES
+from apps.core.partitioning import create_index, drop_index
+from apps.organization.models import Faculty, Program
+from .queryset import ActivityQuerySet, ActivityAnswerQuerySet, ActivityRollupQuerySet
 
 # Create your models here.
 class ActivityTemplate(models.Model):
@@ -32,6 +39,8 @@ class ActivityTemplate(models.Model):
                             "checkbox"
                         ]},
                 "required": {"type": "boolean"},
+                # the integer, number, date and time answers of filterable questions get an index
+                "filterable": {"type": "boolean"},
                 "choices": {"type": "array", "items": {"type": "string"}}
             }
         }
@@ -39,19 +48,74 @@ class ActivityTemplate(models.Model):
     
     name = models.CharField(max_length=255, unique=True)
     template_definition = JSONField(schema=TEMPLATE_SCHEMA)
+    # keep the answers of its activities in ActivityAnswer as well, typed and indexed for reports and filters
+    typed_answers = models.BooleanField(default=False)
 
     def __str__(self): 
         return self.name
 
+    def save(self, *args, **kwargs):
+        previous = ActivityTemplate.objects.filter(pk=self.pk).values_list('template_definition', 'typed_answers').first()
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # the typed answers follow the questions, an unchanged template keeps them
+            if previous != (self.template_definition, self.typed_answers) and (self.typed_answers or previous and previous[1]):
+                ActivityAnswer.objects.rebuild(self)
+
+def sync_response_indexes(template_pk, questions):
+    """
+    Make the partial expression indexes on the activities of a template match its filterable questions:
+    one on `response -> title` per filterable range question, the others are dropped.
+    the index is built CONCURRENTLY so it can't run inside a transaction, but writes go on meanwhile.
+    it takes as long as the activities are many, so it is left to the sync_activity_indexes cron job
+    instead of the request saving the template. a build that failed leaves an INVALID index, which is built again
+    """
+    table = Activity._meta.db_table
+    prefix = f'activity_response_{template_pk}_'
+    wanted = {
+        prefix + md5(question['title'].encode()).hexdigest()[:12]: question['title']
+        for question in questions
+        if question.get('filterable') and question['type'] in RANGE_TYPES
+    }
+    with connection.cursor() as cursor:
+        # the indexes of the table and of its partitions, which are named after them
+        cursor.execute("""
+            SELECT c.relname, i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE starts_with(c.relname, %s)
+        """, [prefix])
+        indexes = cursor.fetchall()
+    name_of = lambda index: index[:len(prefix) + 12]
+    existing = {name_of(index) for index, _ in indexes}
+    broken = {name_of(index) for index, valid in indexes if not valid}
+    for name in existing - (wanted.keys() - broken):
+        drop_index(table, name)
+    # an invalid index of a partition that was never attached doesn't go with the one of the table
+    for index, valid in indexes:
+        if not valid and index != name_of(index):
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP INDEX IF EXISTS {connection.ops.quote_name(index)}')
+    for name in wanted.keys() - (existing - broken):
+        create_index(table, name, f'((response -> %s)) WHERE template_id = {int(template_pk)}', [wanted[name]])
+
 class Activity(OrganizationNullMixin):
     """
     Stores user responses to activity templates with row-level security.
+    the table is partitioned by month of created_at (see the migrations and the activity_partitions command),
+    its primary key is (id, created_at) in postgres
     """
     template = models.ForeignKey(ActivityTemplate, null=True, on_delete=models.SET_NULL)
     response = models.JSONField()
     author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = RLSManager.from_queryset(ActivityQuerySet)()
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if self.template and self.template.typed_answers:
+                ActivityAnswer.objects.project(self.template, [(self.pk, self.response)])
+
     def get_user_rls_filter(self, user):
         return Q(author=user)
 
@@ -59,4 +123,69 @@ class Activity(OrganizationNullMixin):
         return f"{self.template.name if self.template else ''} activity created by {self.author} on {self.created_at.strftime('%Y-%m-%d')}"
 
     class Meta:
-        verbose_name_plural = "Activities"
\ No newline at end of file
+        verbose_name_plural = "Activities"
+        indexes = [GinIndex(fields=['response'], opclasses=['jsonb_path_ops'], name='activity_response_gin')]
+
+class ActivityAnswer(models.Model):
+    """
+    One typed answer of an activity whose template has typed_answers, a ticked checkbox choice per row.
+    the value is in the column of the question type: number for integer and number,
+    date, datetime, time, choice for dropdown and checkbox and text for text and paragraph,
+    which is the only one without an index
+    """
+    # a trigger deletes the answers with their activities (see the migrations),
+    # so deleting activities doesn't need django's collector. the partitioned activities can't be referenced by id
+    activity = models.ForeignKey(Activity, on_delete=models.DO_NOTHING, db_constraint=False, related_name='answers')
+    template = models.ForeignKey(ActivityTemplate, on_delete=models.CASCADE)
+    question = models.CharField(max_length=255)
+    number = models.FloatField(null=True)
+    date = models.DateField(null=True)
+    datetime = models.DateTimeField(null=True)
+    time = models.TimeField(null=True)
+    choice = models.CharField(max_length=255, null=True)
+    text = models.TextField(null=True)
+
+    objects = ActivityAnswerQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.question} of activity {self.activity_id}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['template', 'question', column], condition=Q(**{f'{column}__isnull': False}),
+                         name=f'activity_answer_{column}_idx')
+            for column in ('number', 'date', 'datetime', 'time', 'choice')
+        ]
+
+class ActivityRollup(models.Model):
+    """
+    Number of activities per faculty, program, template and day (in TIME_ZONE, rebuild after changing it).
+    triggers on the activities keep it (see the migrations), so bulk inserts, deletes and moves are counted too
+    and the counts outlive the partitions dropped for retention
+    """
+    # the triggers move the counts before anything is deleted, nothing has to cascade
+    faculty = models.ForeignKey(Faculty, null=True, on_delete=models.DO_NOTHING, db_constraint=False)
+    program = models.ForeignKey(Program, null=True, on_delete=models.DO_NOTHING, db_constraint=False)
+    template = models.ForeignKey(ActivityTemplate, null=True, on_delete=models.DO_NOTHING, db_constraint=False)
+    day = models.DateField()
+    count = models.IntegerField(default=0)
+
+    objects = RLSManager.from_queryset(ActivityRollupQuerySet)()
+
+    def get_user_rls_filter(self, user):
+        # the counts are of everyone's activities, only faculty and program wide access sees them
+        return Q(pk__in=[])
+
+    def __str__(self):
+        return f"{self.count} activities on {self.day}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['faculty', 'program', 'template', 'day'], nulls_distinct=False,
+                                    name='activity_rollup_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['faculty', 'program', 'day'], name='activity_rollup_day_idx'),
+            # the rows a trigger brought to zero, it deletes them right after
+            models.Index(fields=['id'], condition=Q(count=0), name='activity_rollup_zero_idx'),
+        ]
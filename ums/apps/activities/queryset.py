@@ -0,0 +1,135 @@
+from django.core.exceptions import ValidationError
+from django.conf import settings
+from django.db import connections, models, transaction
+from django.db.models import Exists, OuterRef, Sum
+from django.db.models.functions import ExtractMonth
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime, parse_time
+from apps.core.queryset import ResponseQuerySet
+
+def _parse_datetime(value):
+    value = parse_datetime(value)
+    return timezone.make_aware(value) if value and timezone.is_naive(value) else value
+
+# the typed column an answer of each question type is kept in, with its parser
+COLUMNS = {
+    'integer': ('number', float),
+    'number': ('number', float),
+    'date': ('date', parse_date),
+    'date-time': ('datetime', _parse_datetime),
+    'time': ('time', parse_time),
+    'text': ('text', str),
+    'paragraph': ('text', str),
+    'dropdown': ('choice', str),
+    'checkbox': ('choice', str),
+}
+LOOKUPS = {'gte': 'gte', 'lte': 'lte', 'contains': 'icontains'}
+
+def parse_answer(question_type, value):
+    """
+    The typed value of an answer, None when it is empty or doesn't parse as the question type
+    """
+    if value is None or value == '' or isinstance(value, (dict, list, bool)):
+        return None
+    _, parse = COLUMNS[question_type]
+    try:
+        return parse(value)
+    except (TypeError, ValueError):
+        return None
+
+class ActivityQuerySet(ResponseQuerySet):
+    def filter_answers(self, template, conditions):
+        """
+        Like filter_response but on the typed answers of a template with typed_answers,
+        each condition is an EXISTS on the indexed (template, question, value) of its column
+        """
+        Answer = self.model._meta.get_field('answers').related_model
+        types = {question['title']: question['type'] for question in template.template_definition}
+        queryset = self
+        for key, value in conditions.items():
+            title, _, lookup = key.rpartition('__')
+            if lookup not in LOOKUPS or title not in types:
+                title, lookup = key, 'exact'
+            if title not in types:
+                raise ValidationError(f"unknown question: {title}")
+            question_type = types[title]
+            column, _ = COLUMNS[question_type]
+            if lookup == 'contains' and column != 'text' or lookup in ('gte', 'lte') and column in ('text', 'choice'):
+                raise ValidationError(f"{title}: {lookup} doesn't apply to a {question_type} question")
+            typed = value if lookup == 'contains' else parse_answer(question_type, value)
+            if typed is None:
+                raise ValidationError(f"{title}: {value!r} is not a valid {question_type}")
+            queryset = queryset.filter(Exists(Answer.objects.filter(
+                activity=OuterRef('pk'), template=template, question=title,
+                **{f'{column}__{LOOKUPS.get(lookup, lookup)}': typed},
+            )))
+        return queryset
+
+class ActivityAnswerQuerySet(models.QuerySet):
+    def _rows(self, template, activities):
+        for activity_id, response in activities:
+            for question in template.template_definition:
+                column, _ = COLUMNS[question['type']]
+                answer = (response or {}).get(question['title'])
+                # a checkbox is answered with the list of its ticked choices, one row each
+                for value in answer if question['type'] == 'checkbox' and isinstance(answer, list) else [answer]:
+                    typed = parse_answer(question['type'], value)
+                    if typed is not None:
+                        yield self.model(activity_id=activity_id, template=template, question=question['title'],
+                                         **{column: typed})
+
+    def project(self, template, activities, batch_size=1000):
+        """
+        Replace the typed answers of the given (activity id, response) pairs of a template.
+        returns the number of answer rows written
+        """
+        activities = list(activities)
+        with transaction.atomic(using=self.db):
+            self.filter(activity__in=[activity_id for activity_id, _ in activities]).delete()
+            return len(self.bulk_create(self._rows(template, activities), batch_size=batch_size))
+
+    def rebuild(self, template, chunk_size=5000):
+        """
+        Drop the typed answers of a template and project its activities again in chunks,
+        only the dropping when the template doesn't have typed_answers. returns the rows written
+        """
+        Activity = self.model._meta.get_field('activity').related_model
+        written = 0
+        with transaction.atomic(using=self.db):
+            self.filter(template=template).delete()
+            if not template.typed_answers:
+                return 0
+            activities = Activity.objects.filter(template=template).order_by('pk').values_list('pk', 'response')
+            last_pk = 0
+            while chunk := list(activities.filter(pk__gt=last_pk)[:chunk_size]):
+                written += len(self.bulk_create(self._rows(template, chunk), batch_size=1000))
+                last_pk = chunk[-1][0]
+        return written
+
+class ActivityRollupQuerySet(models.QuerySet):
+    def per_month(self, year):
+        """
+        (template id, month, count) of the year, months numbered from 1
+        """
+        return self.filter(day__year=year).annotate(month=ExtractMonth('day')) \
+            .values_list('template', 'month').annotate(count=Sum('count')).order_by('template', 'month')
+
+    def rebuild(self):
+        """
+        Count every activity again in one INSERT ... SELECT. the days of dropped partitions are lost.
+        returns the number of rows written
+        """
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        table = qn(self.model._meta.db_table)
+        activities = qn(self.model._meta.apps.get_model('activities', 'Activity')._meta.db_table)
+        with transaction.atomic(using=self.db), connection.cursor() as cursor:
+            # keep activity writers out until the new counts are in, their triggers would count twice otherwise
+            cursor.execute(f'LOCK TABLE {activities} IN SHARE MODE')
+            cursor.execute(f'DELETE FROM {table}')
+            cursor.execute(f"""
+                INSERT INTO {table} (faculty_id, program_id, template_id, day, count)
+                SELECT faculty_id, program_id, template_id, (created_at AT TIME ZONE %s)::date, COUNT(*)
+                FROM {activities} GROUP BY 1, 2, 3, 4
+            """, [settings.TIME_ZONE])
+            return cursor.rowcount
@@ -10,6 +10,7 @@ urlpatterns = [
     path('create/<int:template_pk>/', views.ActivityCreateView.as_view(), name='submit_activity'),
     path('delete/<int:pk>', views.ActivityDeleteView.as_view(), name='delete_activity'),
     path('delete/', views.ActivityBulkDeleteView.as_view(), name='delete_activity'),
+    path('per-month/', views.ActivityRollupView.as_view(), name='view_activityrollup'),
     # activity template
     path('templates/', views.ActivityTemplateListView.as_view(), name='view_activitytemplate'),
     path('templates/create/', views.ActivityTemplateCreateView.as_view(), name='add_activitytemplate'),
@@ -1,20 +1,90 @@
+import calendar
+from datetime import datetime, time, timedelta
 from django.views.generic import ListView
+from django.utils import timezone
+from django.core.exceptions import ValidationError
+from django.utils.dateparse import parse_date
 from apps.core.forms import json_to_schema
 from django.forms.models import modelform_factory
 from django_jsonform.widgets import JSONFormWidget
-from apps.core.views import BaseDeleteView, BaseListView, BaseCreateView, BaseUpdateView, BaseBulkDeleteView
+from apps.core.views import BaseDeleteView, BaseListView, BaseCreateView, BaseUpdateView, BaseBulkDeleteView, ResponseFilterMixin
 from apps.core.forms import json_to_schema
-from .models import Activity, ActivityTemplate
+from .models import Activity, ActivityTemplate, ActivityRollup
 
-class ActivityListView(BaseListView):
+class ActivityListView(ResponseFilterMixin, BaseListView):
     """
     View for listing all activities.
+    ?since=<date> and ?until=<date> narrow it to the activities created in between,
+    ?template=<pk> narrows it to a template, whose answers can then be filtered on with ?response.<title>=,
+    through the typed answers when the template has them
     """
     model = Activity
     table_fields = ['author', 'template', 'created_at', 'response']
     object_actions = [('🗑️', 'activities:delete_activity', None)]
     actions = [('+', 'activities:add_activity', None),
-    ('clear all', 'activities:delete_activity', None)]
+    ('clear all', 'activities:delete_activity', None),
+    ('per month', 'activities:view_activityrollup', 'view_activity')]
+
+    def get_response_template(self):
+        template = ActivityTemplate.objects.filter(pk=self.request.GET.get('template') or None).first()
+        if not template:
+            raise ValidationError("pick a template to filter on its answers")
+        return template
+
+    def get_response_questions(self):
+        return self.get_response_template().template_definition
+
+    def filter_response(self, queryset, conditions):
+        # the typed answers are indexed for every question, the json only for the filterable ones
+        template = self.get_response_template()
+        if template.typed_answers:
+            return queryset.filter_answers(template, conditions)
+        return queryset.filter_response(template.template_definition, conditions)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.GET.get('template'):
+            queryset = queryset.filter(template=self.request.GET['template'])
+        # a range on created_at itself (not its date) only scans the partitions of its months
+        for param, lookup, days in [('since', 'gte', 0), ('until', 'lt', 1)]:
+            if self.request.GET.get(param):
+                day = parse_date(self.request.GET[param])
+                if not day:
+                    raise ValidationError(f"{param}: {self.request.GET[param]!r} is not a date")
+                start = timezone.make_aware(datetime.combine(day + timedelta(days=days), time.min))
+                queryset = queryset.filter(**{f'created_at__{lookup}': start})
+        return queryset
+
+class ActivityRollupView(BaseListView):
+    """
+    Activities per template and month of a year (?year=, this one by default) of the selected faculty and program,
+    read from the rollups instead of counting the activities
+    """
+    model = Activity
+    template_name = 'activities/activity_rollup.html'
+
+    def get_queryset(self):
+        try:
+            self.year = int(self.request.GET.get('year') or timezone.localdate().year)
+        except ValueError:
+            raise ValidationError(f"{self.request.GET['year']!r} is not a year")
+        templates = dict(ActivityTemplate.objects.values_list('pk', 'name'))
+        rows = {}
+        for template, month, count in ActivityRollup.objects.get_queryset(request=self.request).per_month(self.year):
+            rows.setdefault(template, [0] * 12)[month - 1] = count
+        return sorted(
+            ({'name': templates.get(template, 'no template'), 'months': months, 'total': sum(months)}
+             for template, months in rows.items()),
+            key=lambda row: row['name'],
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['year'] = self.year
+        context['month_names'] = list(calendar.month_abbr)[1:]
+        context['months'] = [sum(row['months'][i] for row in self.object_list) for i in range(12)]
+        context['total'] = sum(context['months'])
+        return context
 
 class ActivityTemplateSelectView(ListView):
     """
@@ -5,3 +5,8 @@ class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.core'
     label = 'core'
+
+    def ready(self):
+        from . import audit, metrics
+        audit.install()
+        metrics.install()
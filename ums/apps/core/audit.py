@@ -0,0 +1,129 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+from auditlog import receivers
+from auditlog.diff import model_instance_diff
+from auditlog.models import LogEntry, LogEntryManager
+from auditlog.registry import auditlog
+from auditlog.signals import post_log, pre_log
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models.signals import pre_save
+
+# the buffer of the request (or buffered_audit block) being run, None writes every entry right away.
+# the per row entries of auditlog's receivers and those of log_bulk are buffered, LogEntry.objects is left alone
+_buffer = ContextVar('audit_buffer', default=None)
+_create_log_entry = receivers._create_log_entry
+
+BULK_LABELS = {
+    LogEntry.Action.CREATE: 'created',
+    LogEntry.Action.UPDATE: 'updated',
+    LogEntry.Action.DELETE: 'deleted',
+}
+
+class AuditBuffer:
+    """
+    The committed log entries not written yet, they go in one bulk_create per AUDITLOG_BATCH_SIZE entries
+    and when the block that collects them is over
+    """
+    def __init__(self):
+        self.entries = []
+        self.closed = False
+
+    def add(self, entry):
+        self.entries.append(entry)
+        # a transaction that commits after its block was over has nothing to wait for
+        if self.closed or len(self.entries) >= settings.AUDITLOG_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        entries, self.entries = self.entries, []
+        if entries:
+            LogEntry.objects.bulk_create(entries)
+
+@contextmanager
+def buffered_audit():
+    """
+    Collect the audit log entries written inside the block, by auditlog's receivers and log_bulk,
+    instead of inserting them one by one.
+    an entry is only kept once the transaction of its change commits, so a rollback drops it as before
+    """
+    buffer = AuditBuffer()
+    token = _buffer.set(buffer)
+    try:
+        yield buffer
+    finally:
+        _buffer.reset(token)
+        buffer.closed = True
+        buffer.flush()
+
+class BufferedLogEntryManager(LogEntryManager):
+    """
+    LogEntry.objects.log_create and create for the entries of the buffer being run:
+    the entry is built as auditlog would save it and added to the buffer once its transaction commits
+    """
+    def create(self, **kwargs):
+        entry = self.model(**kwargs)
+        # auditlog's set_actor fills the actor in on pre_save, which bulk_create doesn't send
+        pre_save.send(sender=self.model, instance=entry, raw=False, using=self.db, update_fields=None)
+        transaction.on_commit(partial(_buffer.get().add, entry))
+        return entry
+
+_buffered_entries = BufferedLogEntryManager()
+_buffered_entries.model = LogEntry
+
+def _buffered_create_log_entry(action, instance, sender, diff_old, diff_new, fields_to_check=None,
+                               force_log=False, use_json_for_changes=False):
+    """
+    auditlog's receivers._create_log_entry, the entry going to the buffer when there is one.
+    the diff is taken right away, as the receivers see the row before and after its change
+    """
+    if _buffer.get() is None:
+        return _create_log_entry(action, instance, sender, diff_old, diff_new, fields_to_check=fields_to_check,
+                                 force_log=force_log, use_json_for_changes=use_json_for_changes)
+    pre_log_results = pre_log.send(sender, instance=instance, action=action)
+    if any(result is False for _, result in pre_log_results):
+        return
+    changes = model_instance_diff(diff_old, diff_new, fields_to_check=fields_to_check,
+                                  use_json_for_changes=use_json_for_changes)
+    if force_log or changes:
+        entry = _buffered_entries.log_create(instance, action=action, changes=changes, force_log=force_log)
+        post_log.send(
+            sender, instance=instance, instance_old=diff_old, action=action, error=None,
+            pre_log_results=pre_log_results, changes=changes, log_entry=entry, log_created=True,
+            use_json_for_changes=use_json_for_changes,
+        )
+
+def install():
+    # the receivers auditlog connects for every tracked model look the function up when a row is saved or deleted
+    receivers._create_log_entry = _buffered_create_log_entry
+
+def log_bulk(model, action, count, actor=None):
+    """
+    One audit log entry for a bulk create, update or delete of `count` rows of a model auditlog tracks,
+    instead of the per row entries that bulk operations skip. inside buffered_audit the entry is kept
+    until its transaction commits and written with the others. returns it, or None when nothing is logged
+    """
+    if not count or not auditlog.contains(model):
+        return None
+    label = BULK_LABELS[action]
+    entries = LogEntry.objects if _buffer.get() is None else _buffered_entries
+    return entries.create(
+        content_type=ContentType.objects.get_for_model(model),
+        object_pk='',
+        object_repr=f'{count} {model._meta.verbose_name_plural} (bulk {label.removesuffix("d")})',
+        action=action,
+        changes={label: count},
+        # the request's actor is filled in by auditlog otherwise
+        actor=actor if actor and actor.is_authenticated else None,
+    )
+
+def history(instance, since=None):
+    """
+    The audit log entries of an object, newest first. with `since` only the partitions from then on are read
+    """
+    entries = LogEntry.objects.get_for_object(instance)
+    if since:
+        entries = entries.filter(timestamp__gte=since)
+    return entries.order_by('-timestamp')
@@ -0,0 +1,24 @@
+from contextlib import contextmanager
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError
+
+def violated_constraint(error):
+    """
+    The name of the database constraint an IntegrityError is about, '' when the driver doesn't say
+    """
+    return getattr(getattr(error.__cause__, 'diag', None), 'constraint_name', None) or ''
+
+@contextmanager
+def constraint_errors(errors):
+    """
+    Raise errors[suffix] as a ValidationError when a statement of the block violates a database constraint
+    whose name ends with one of the suffixes, instead of the IntegrityError. any other IntegrityError goes through
+    """
+    try:
+        yield
+    except IntegrityError as e:
+        constraint = violated_constraint(e)
+        for suffix, message in errors.items():
+            if constraint.endswith(suffix):
+                raise ValidationError(message) from e
+        raise
@@ -1,5 +1,5 @@
 from django.contrib.auth.models import Group
-from apps.organization.models import Faculty, Program
+from apps.organization.tree import get_tree
 
 def organization_data(request):
     """
@@ -21,22 +21,24 @@ def organization_data(request):
         s['selected_group'] = user.groups.first().id
         s['permissions'] = list(Group.objects.get(id=s['selected_group']).permissions.all().values_list('codename', flat=True))
 
-    # affiliation
-    user_faculties = user.faculties.all()
+    # affiliation, the faculties and programs come from the organization tree
+    tree = get_tree()
+    user_faculties = sorted(user.faculties.values_list('id', flat=True))
+    user_programs = sorted(user.programs.values_list('id', flat=True))
     if 'access_global' in s['permissions']:
-        context['all_faculties'] = Faculty.objects.all()
-        context['all_programs'] = Program.objects.select_related('faculty').all()
+        context['all_faculties'] = list(tree.faculties.values())
+        context['all_programs'] = list(tree.programs.values())
     elif 'access_faculty_wide' in s['permissions']:
-        context['all_faculties'] = user_faculties
-        context['all_programs'] = Program.objects.select_related('faculty').filter(faculty__in=user_faculties)
+        context['all_faculties'] = [tree.faculties[pk] for pk in user_faculties if pk in tree.faculties]
+        context['all_programs'] = [program for pk in user_faculties for program in tree.programs_of(pk)]
     else:
-        context['all_faculties'] = user_faculties
-        context['all_programs'] = user.programs.select_related('faculty').all()
+        context['all_faculties'] = [tree.faculties[pk] for pk in user_faculties if pk in tree.faculties]
+        context['all_programs'] = [tree.programs[pk] for pk in user_programs if pk in tree.programs]
     
     # select the first affiliation if not empty
-    if user_faculties.exists() and not s.get('selected_faculty'):
-        s['selected_faculty'] = user_faculties.first().id
-    if user.programs.exists() and not s.get('selected_program'):
-        s['selected_program'] = user.programs.first().id
+    if user_faculties and not s.get('selected_faculty'):
+        s['selected_faculty'] = user_faculties[0]
+    if user_programs and not s.get('selected_program'):
+        s['selected_program'] = user_programs[0]
     
     return context
@@ -0,0 +1,58 @@
+from auditlog.models import LogEntry
+from django.db import models, router, transaction
+from django.db.models.signals import pre_delete, post_delete, m2m_changed
+from .audit import log_bulk
+
+CHUNK_SIZE = 5000
+
+def _has_delete_receivers(model):
+    # auditlog's per row entries are replaced by the summary entry, anything else must still run
+    for signal in (pre_delete, post_delete):
+        sync_receivers, async_receivers = signal._live_receivers(model)
+        if any(not receiver.__module__.startswith('auditlog') for receiver in [*sync_receivers, *async_receivers]):
+            return True
+    return False
+
+def needs_collector(model):
+    """
+    Whether deleting rows of the model has to go through django's collector:
+    something points at it with an on_delete to carry out, it has m2m rows to clear
+    or a delete signal receiver other than auditlog's
+    """
+    opts = model._meta
+    if any(rel.on_delete is not models.DO_NOTHING for rel in opts.related_objects):
+        return True
+    if opts.many_to_many or any(field.many_to_many or field.one_to_many for field in opts.private_fields):
+        return True
+    return _has_delete_receivers(model) or m2m_changed.has_listeners(model)
+
+def bulk_delete(queryset, actor=None, chunk_size=CHUNK_SIZE):
+    """
+    Delete every row of the queryset in primary key ordered chunks, each in its own short transaction.
+    the chunks are deleted with a single DELETE when nothing depends on the rows, the collector
+    (and its per object queries and signals) is only used when needs_collector says so.
+    one summary entry is written to the audit log (see log_bulk), returns the number of rows deleted
+    """
+    model = queryset.model
+    using = router.db_for_write(model)
+    use_collector = needs_collector(model)
+    queryset = queryset.order_by()
+    deleted = 0
+    last_pk = None
+
+    while True:
+        remaining = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        # the pk that closes the chunk, none when less than a chunk is left
+        boundary = list(remaining.order_by('pk').values_list('pk', flat=True)[chunk_size - 1:chunk_size])
+        chunk = remaining.filter(pk__lte=boundary[0]) if boundary else remaining
+        with transaction.atomic(using=using):
+            if use_collector:
+                deleted += chunk.delete()[1].get(model._meta.label, 0)
+            else:
+                deleted += chunk._raw_delete(using)
+        if not boundary:
+            break
+        last_pk = boundary[0]
+
+    log_bulk(model, LogEntry.Action.DELETE, deleted, actor)
+    return deleted
@@ -1,3 +1,9 @@
+from datetime import date, datetime, time
+from django import forms
+from django.urls import reverse
+from django.core.exceptions import ValidationError
+from django.forms.models import ModelChoiceIterator
+
 def json_to_schema(template_json):
     schema = {
         "type": "object",
@@ -31,4 +37,128 @@ def json_to_schema(template_json):
                     "choices": field['choices'],
                     "widget": "multiselect"
                 }
-    return schema
\ No newline at end of file
+    return schema
+
+def _is_type(types):
+    # bool is an int in python but not in json
+    return lambda value: isinstance(value, types) and not isinstance(value, bool)
+
+def _parses(parse):
+    def check(value):
+        try:
+            parse(value)
+            return True
+        except (TypeError, ValueError):
+            return False
+    return check
+
+_FORMAT_CHECKS = {
+    'date': _parses(date.fromisoformat),
+    'date-time': _parses(datetime.fromisoformat),
+    'time': _parses(time.fromisoformat),
+}
+
+def schema_to_validator(schema):
+    """
+    Compile a schema made by json_to_schema into a function that checks a response against it.
+    the checks of every key are worked out once here instead of walking the schema per response.
+    the function raises ValidationError listing every problem
+    """
+    checks = []
+    for title, key in schema['keys'].items():
+        match key['type']:
+            case 'integer':
+                check = _is_type(int)
+            case 'number':
+                check = _is_type((int, float))
+            case 'array':
+                choices = set(key['items']['choices'])
+                check = lambda value, choices=choices: isinstance(value, list) and \
+                    all(isinstance(item, str) and item in choices for item in value)
+            case _:
+                check = _is_type(str)
+                if 'choices' in key:
+                    choices = set(key['choices'])
+                    check = lambda value, choices=choices: isinstance(value, str) and value in choices
+                elif 'format' in key:
+                    check = _FORMAT_CHECKS[key['format']]
+        checks.append((title, key['required'], check))
+    titles = set(schema['keys'])
+
+    def validate(response):
+        if not isinstance(response, dict):
+            raise ValidationError("the response must be an object")
+        errors = [f"unknown question: {title}" for title in response.keys() - titles]
+        for title, required, check in checks:
+            value = response.get(title)
+            if value in (None, '', []):
+                if required:
+                    errors.append(f"{title} is required")
+            elif not check(value):
+                errors.append(f"{title}: invalid answer {value!r}")
+        if errors:
+            raise ValidationError(errors)
+    return validate
+
+class PrefetchedModelChoiceIterator(ModelChoiceIterator):
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for obj in self.field.objects.values():
+            yield self.choice(obj)
+
+    def __len__(self):
+        return len(self.field.objects) + (self.field.empty_label is not None)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self.field.objects)
+
+class PrefetchedModelChoiceField(forms.ModelChoiceField):
+    """
+    ModelChoiceField over objects that were already fetched, usually once for a whole formset.
+    rendering and validating it doesn't hit the db
+    """
+    iterator = PrefetchedModelChoiceIterator
+
+    def __init__(self, queryset, objects, **kwargs):
+        self.objects = {str(obj.pk): obj for obj in objects}
+        super().__init__(queryset, **kwargs)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        if isinstance(value, self.queryset.model):
+            value = value.pk
+        try:
+            return self.objects[str(value)]
+        except KeyError:
+            raise ValidationError(
+                self.error_messages['invalid_choice'], code='invalid_choice', params={'value': value}
+            )
+
+class AutocompleteSelect(forms.Select):
+    """
+    Select for big querysets. only the chosen option is rendered,
+    select2 fetches the rest from the autocomplete url as the user types
+    """
+    def __init__(self, url, attrs=None):
+        super().__init__(attrs)
+        self.url = url
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['attrs']['data-autocomplete-url'] = reverse(self.url)
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        selected = [str(v) for v in value if str(v).isdigit()]
+        options = [self.create_option(name, '', '---------', not selected, 0)]
+        if selected:
+            field = self.choices.field
+            if isinstance(field, PrefetchedModelChoiceField):
+                objs = [field.objects[pk] for pk in selected if pk in field.objects]
+            else:
+                objs = field.queryset.filter(pk__in=selected)
+            for index, obj in enumerate(objs, start=1):
+                options.append(self.create_option(name, obj.pk, field.label_from_instance(obj), True, index))
+        return [(None, options, 0)]
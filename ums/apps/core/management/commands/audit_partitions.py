@@ -0,0 +1,18 @@
+from auditlog.models import LogEntry
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from apps.core.partitioning import rotate_partitions
+
+class Command(BaseCommand):
+    help = 'Create the monthly audit log partitions ahead of time and drop (or detach) the ones past retention'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=3, help='months to create partitions for, this one included')
+        parser.add_argument('--keep', type=int, default=settings.AUDITLOG_RETENTION_MONTHS,
+                            help='months of audit log to keep, this one included, none keeps every month')
+        parser.add_argument('--detach', action='store_true', help='detach the old partitions instead of dropping them')
+
+    def handle(self, *args, **options):
+        for action, name in rotate_partitions(LogEntry._meta.db_table, 'timestamp', options['ahead'],
+                                              options['keep'], options['detach']):
+            self.stdout.write(f'{action} {name}')
@@ -0,0 +1,243 @@
+import atexit
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.apps import apps
+from django.conf import settings
+
+# the totals of this worker as {prometheus sample: value}, like {'ums_sql_queries_total{view="home"}': 12}.
+# every worker writes its own to METRICS_DIR/<pid>.json now and then and /metrics adds them all up
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FAMILIES = {
+    'ums_requests_total': ('counter', 'Requests per view and status code'),
+    'ums_request_duration_seconds': ('histogram', 'Time spent in the middleware and the view per view'),
+    'ums_sql_queries_total': ('counter', 'SQL queries run per view'),
+    'ums_sql_seconds_total': ('counter', 'Time spent running SQL queries per view'),
+    'ums_cachalot_hits_total': ('counter', 'ORM queries answered from the cachalot cache per view'),
+    'ums_cachalot_misses_total': ('counter', 'ORM queries cachalot could cache but had to run per view'),
+    'ums_session_writes_total': ('counter', 'Requests that saved their session per view'),
+    'ums_response_bytes_total': ('counter', 'Bytes of response bodies per view'),
+}
+# the file the totals of workers that exited are folded into, at a scrape or when a new worker gets their pid
+EXITED = 'exited.json'
+
+_current = ContextVar('request_metrics', default=None)
+_lock = threading.Lock()
+_totals = {}
+_owner = None
+_flushed = 0.0
+# the pid whose file is ours, once a file an exited worker left under it was folded away
+_claimed = None
+
+class RequestMetrics:
+    """
+    What one request did, collected while it runs
+    """
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def execute(self, execute, sql, params, many, context):
+        # a connection.execute_wrapper
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_seconds += time.perf_counter() - start
+            self.queries += 1
+
+@contextmanager
+def collect():
+    metrics = RequestMetrics()
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+def _labels(**labels):
+    return ','.join('{}="{}"'.format(name, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+                    for name, value in labels.items())
+
+def _add(samples):
+    global _owner
+    with _lock:
+        if _owner != os.getpid():
+            # a worker forked off a process that counted already starts from nothing
+            _totals.clear()
+            _owner = os.getpid()
+        for sample, value in samples:
+            _totals[sample] = _totals.get(sample, 0) + value
+
+def observe(view, status, duration, metrics, session_written, size):
+    """
+    Count a request that is over
+    """
+    view = _labels(view=view)
+    samples = [
+        (f'ums_requests_total{{{view},{_labels(status=status)}}}', 1),
+        *((f'ums_request_duration_seconds_bucket{{{view},{_labels(le=le)}}}', int(duration <= le)) for le in BUCKETS),
+        (f'ums_request_duration_seconds_bucket{{{view},le="+Inf"}}', 1),
+        (f'ums_request_duration_seconds_sum{{{view}}}', duration),
+        (f'ums_request_duration_seconds_count{{{view}}}', 1),
+        (f'ums_sql_queries_total{{{view}}}', metrics.queries),
+        (f'ums_sql_seconds_total{{{view}}}', metrics.sql_seconds),
+        (f'ums_cachalot_hits_total{{{view}}}', metrics.cache_hits),
+        (f'ums_cachalot_misses_total{{{view}}}', metrics.cache_misses),
+        (f'ums_session_writes_total{{{view}}}', int(session_written)),
+    ]
+    if size is not None:
+        samples.append((f'ums_response_bytes_total{{{view}}}', size))
+    _add(samples)
+    if time.monotonic() - _flushed > settings.METRICS_FLUSH_SECONDS:
+        flush()
+
+def observe_streamed(view, size):
+    # a streamed response is only sized once it has been sent, after the request was counted
+    _add([(f'ums_response_bytes_total{{{_labels(view=view)}}}', size)])
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _write(path, totals):
+    # readers see the old file or the new one, never half of it
+    tmp = path.with_name(f'.{path.name}.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(totals, f)
+    os.replace(tmp, path)
+
+def _merge(into, totals):
+    for sample, value in totals.items():
+        into[sample] = into.get(sample, 0) + value
+    return into
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _fold(directory, paths):
+    """
+    Add the files of workers that exited to EXITED and remove them, so a scrape reads one file per live worker
+    """
+    with open(directory / f'{EXITED}.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        paths = [path for path in paths if path.exists()]
+        if not paths:
+            return
+        exited = _read(directory / EXITED)
+        for path in paths:
+            _merge(exited, _read(path))
+        _write(directory / EXITED, exited)
+        for path in paths:
+            path.unlink()
+
+def flush():
+    """
+    Write the totals of this worker to its file
+    """
+    global _flushed, _claimed
+    directory = settings.METRICS_DIR
+    with _lock:
+        if _owner != os.getpid():
+            return
+        totals = dict(_totals)
+        _flushed = time.monotonic()
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f'{os.getpid()}.json'
+    if _claimed != os.getpid():
+        # a file with our pid is from a worker that exited, its totals must still count
+        _fold(directory, [path])
+        _claimed = os.getpid()
+    _write(path, totals)
+
+def totals():
+    """
+    The totals of every worker, this one's up to now
+    """
+    directory = settings.METRICS_DIR
+    merged = {}
+    own = f'{_claimed}.json'
+    if directory.is_dir():
+        dead = [
+            path for path in directory.glob('*.json')
+            if path.stem.isdigit() and int(path.stem) != os.getpid() and not _alive(int(path.stem))
+        ]
+        if dead:
+            _fold(directory, dead)
+        for path in directory.glob('*.json'):
+            if path.name != own:
+                _merge(merged, _read(path))
+    with _lock:
+        if _owner == os.getpid():
+            _merge(merged, _totals)
+    return merged
+
+def _family(sample):
+    name = sample.split('{', 1)[0]
+    for suffix in ('_bucket', '_sum', '_count'):
+        if name.endswith(suffix) and name.removesuffix(suffix) in FAMILIES:
+            return name.removesuffix(suffix)
+    return name
+
+def render():
+    """
+    The totals in the prometheus text format
+    """
+    families = {}
+    for sample, value in totals().items():
+        families.setdefault(_family(sample), []).append((sample, value))
+    lines = []
+    for family, samples in families.items():
+        kind, description = FAMILIES.get(family, ('untyped', ''))
+        lines += [f'# HELP {family} {description}', f'# TYPE {family} {kind}']
+        if kind == 'histogram':
+            # the buckets of a view go together, from the smallest
+            samples.sort(key=lambda sample: _bucket_order(sample[0]))
+        lines += [f'{sample} {value}' for sample, value in samples]
+    return '\n'.join(lines) + '\n'
+
+def _bucket_order(sample):
+    name, labels = sample.split('{', 1)
+    view = labels.split(',le=', 1)[0].removesuffix('}')
+    if name.endswith('_bucket'):
+        le = labels.rsplit('le="', 1)[1].split('"', 1)[0]
+        return view, 0, float('inf') if le == '+Inf' else float(le)
+    return view, 1 if name.endswith('_sum') else 2, 0
+
+def _counted_cachalot(original):
+    def inner(execute_query_func, *args, **kwargs):
+        executed = False
+
+        def execute():
+            nonlocal executed
+            executed = True
+            return execute_query_func()
+        result = original(execute, *args, **kwargs)
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.cache_misses += executed
+            metrics.cache_hits += not executed
+        return result
+    return inner
+
+def install():
+    # cachalot answers every cachable ORM query in _get_result_or_execute_query, which only runs it on a miss
+    if apps.is_installed('cachalot'):
+        from cachalot import monkey_patch
+        monkey_patch._get_result_or_execute_query = _counted_cachalot(monkey_patch._get_result_or_execute_query)
+    atexit.register(flush)
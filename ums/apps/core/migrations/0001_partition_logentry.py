@@ -0,0 +1,18 @@
+from django.db import migrations
+from apps.core.partitioning import PartitionByMonth
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auditlog', '0017_add_actor_email'),
+    ]
+
+    operations = [
+        PartitionByMonth('logentry', 'timestamp', ahead=3, app_label='auditlog'),
+        # the history of an object, newest first, and bounded by time it only reads the partitions of that time
+        migrations.RunSQL(
+            'CREATE INDEX auditlog_logentry_history_idx ON auditlog_logentry (content_type_id, object_id, "timestamp" DESC)',
+            'DROP INDEX auditlog_logentry_history_idx',
+        ),
+    ]
@@ -0,0 +1,240 @@
+import re
+from datetime import date
+from django.db import connection, transaction
+from django.db.migrations.operations.base import Operation
+from django.utils import timezone
+
+# monthly range partitions of a table on a timestamp column, named <table>_y<year>m<month>,
+# with a default partition that catches the rows of months nobody created a partition for
+DEFAULT_SUFFIX = 'default'
+
+def first_of_month(day, months=0):
+    # the first day of the month of `day`, `months` months later
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def _suffix(month):
+    return f'y{month.year}m{month.month:02}'
+
+def _bounds(month):
+    # utc midnights, the bounds of a timestamptz partition
+    return f'{month.isoformat()} 00:00+00', f'{first_of_month(month, 1).isoformat()} 00:00+00'
+
+def is_partitioned(table):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT EXISTS (SELECT FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))", [table])
+        return cursor.fetchone()[0]
+
+def partitions(table):
+    """
+    {first day of the month: partition name} of the monthly partitions of a table
+    """
+    pattern = re.compile(rf'^{re.escape(table)}_y(\d{{4}})m(\d{{2}})$')
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = %s::regclass", [table])
+        names = [name for name, in cursor.fetchall()]
+    return {
+        date(int(match[1]), int(match[2]), 1): name
+        for name in names if (match := pattern.match(name))
+    }
+
+def create_partitions(table, column, start, months):
+    """
+    Create the partitions of `months` months from the month of `start` that don't exist yet.
+    rows of those months that landed in the default partition are moved into them.
+    returns the names of the partitions created
+    """
+    qn = connection.ops.quote_name
+    default = f'{table}_{DEFAULT_SUFFIX}'
+    existing = partitions(table)
+    created = []
+    for month in (first_of_month(start, i) for i in range(months)):
+        if month in existing:
+            continue
+        name = f'{table}_{_suffix(month)}'
+        lower, upper = _bounds(month)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'LOCK TABLE {qn(default)} IN SHARE ROW EXCLUSIVE MODE')
+            cursor.execute(f'SELECT EXISTS (SELECT FROM {qn(default)} WHERE {qn(column)} >= %s AND {qn(column)} < %s)',
+                           [lower, upper])
+            if not cursor.fetchone()[0]:
+                cursor.execute(f'CREATE TABLE {qn(name)} PARTITION OF {qn(table)} FOR VALUES FROM (%s) TO (%s)',
+                               [lower, upper])
+            else:
+                # the new partition can't overlap rows of the default one, they are moved into it before attaching
+                cursor.execute(f'CREATE TABLE {qn(name)} (LIKE {qn(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+                cursor.execute(f"""
+                    WITH moved AS (
+                        DELETE FROM {qn(default)} WHERE {qn(column)} >= %s AND {qn(column)} < %s RETURNING *
+                    )
+                    INSERT INTO {qn(name)} SELECT * FROM moved
+                """, [lower, upper])
+                cursor.execute(f'ALTER TABLE {qn(table)} ATTACH PARTITION {qn(name)} FOR VALUES FROM (%s) TO (%s)',
+                               [lower, upper])
+        created.append(name)
+    return created
+
+def old_partitions(table, before):
+    """
+    The names of the monthly partitions that only hold rows from before the month of `before`, oldest first
+    """
+    return [name for month, name in sorted(partitions(table).items()) if month < first_of_month(before)]
+
+def drop_partition(table, name, detach=False):
+    """
+    Drop a partition, or only detach it from the table so it can be archived and dropped later.
+    either way it takes no longer with more rows
+    """
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {qn(table)} DETACH PARTITION {qn(name)}')
+        if not detach:
+            cursor.execute(f'DROP TABLE {qn(name)}')
+
+def rotate_partitions(table, column, ahead, keep=None, detach=False, before_drop=None):
+    """
+    Create the partitions of this month and the next ones, `ahead` months in all, then drop (or detach)
+    the ones older than the last `keep` months, each in a transaction with before_drop(partition name) run first.
+    yields ('created' | 'dropped' | 'detached', partition name)
+    """
+    today = timezone.now().date()
+    for name in create_partitions(table, column, today, ahead):
+        yield 'created', name
+    if not keep:
+        return
+    for name in old_partitions(table, first_of_month(today, 1 - keep)):
+        with transaction.atomic():
+            if before_drop:
+                before_drop(name)
+            drop_partition(table, name, detach=detach)
+        yield 'detached' if detach else 'dropped', name
+
+def create_index(table, name, definition, params=()):
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS <name> ON <table> <definition>.
+    a partitioned table can't be indexed concurrently, so there each partition is
+    and the indexes are attached to an index created ON ONLY the table
+    """
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        if not is_partitioned(table):
+            cursor.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {qn(name)} ON {qn(table)} {definition}', params)
+            return
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {qn(name)} ON ONLY {qn(table)} {definition}', params)
+        cursor.execute("SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = %s::regclass", [table])
+        for partition, in cursor.fetchall():
+            child = f'{name}_{partition.removeprefix(table + "_")}'
+            cursor.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {qn(child)} ON {qn(partition)} {definition}', params)
+            cursor.execute(f'ALTER INDEX {qn(name)} ATTACH PARTITION {qn(child)}')
+
+def drop_index(table, name):
+    # the index of a partitioned table can't be dropped concurrently, it goes with the ones of its partitions
+    concurrently = '' if is_partitioned(table) else 'CONCURRENTLY '
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP INDEX {concurrently}IF EXISTS {connection.ops.quote_name(name)}')
+
+def _rebuild(schema_editor, table, partition_by=None, ahead=0):
+    # the table is renamed away and created again, partitioned or not, with the same columns, rows,
+    # indexes, foreign keys and triggers. the primary key takes the partition column in as postgres requires
+    qn = schema_editor.quote_name
+    old = f'{table}_old'
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {qn(table)} IN ACCESS EXCLUSIVE MODE')
+        cursor.execute("SELECT conrelid::regclass::text FROM pg_constraint WHERE confrelid = %s::regclass", [table])
+        if referencing := [name for name, in cursor.fetchall()]:
+            raise ValueError(f"{table} is referenced by foreign keys of {', '.join(referencing)}, drop them first")
+        cursor.execute("""
+            SELECT c.conname, a.attname FROM pg_constraint c
+            JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = c.conkey[1]
+            WHERE c.conrelid = %s::regclass AND c.contype = 'p'
+        """, [table])
+        pk_name, pk_column = cursor.fetchone()
+        cursor.execute("""
+            SELECT indexdef FROM pg_indexes WHERE tablename = %s
+            AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass)
+        """, [table, table])
+        indexes = [definition for definition, in cursor.fetchall()]
+        cursor.execute("""
+            SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+            WHERE conrelid = %s::regclass AND contype IN ('f', 'u')
+        """, [table])
+        constraints = cursor.fetchall()
+        cursor.execute("SELECT pg_get_triggerdef(oid) FROM pg_trigger WHERE tgrelid = %s::regclass AND NOT tgisinternal",
+                       [table])
+        triggers = [definition for definition, in cursor.fetchall()]
+        cursor.execute(f'SELECT MIN({qn(partition_by)}) FROM {qn(table)}' if partition_by else 'SELECT NULL')
+        first = cursor.fetchone()[0]
+
+        cursor.execute(f'ALTER TABLE {qn(table)} RENAME TO {qn(old)}')
+        # the names are needed for the new table
+        cursor.execute(f'ALTER TABLE {qn(old)} DROP CONSTRAINT {qn(pk_name)} CASCADE')
+        for name, _ in constraints:
+            cursor.execute(f'ALTER TABLE {qn(old)} DROP CONSTRAINT IF EXISTS {qn(name)}')
+        cursor.execute(f"SELECT indexname FROM pg_indexes WHERE tablename = %s", [old])
+        for name, in cursor.fetchall():
+            cursor.execute(f'DROP INDEX {qn(name)}')
+
+        like = f'LIKE {qn(old)} INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING CONSTRAINTS INCLUDING GENERATED'
+        if partition_by:
+            cursor.execute(f'CREATE TABLE {qn(table)} ({like}) PARTITION BY RANGE ({qn(partition_by)})')
+            cursor.execute(f'ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(pk_name)} PRIMARY KEY ({qn(pk_column)}, {qn(partition_by)})')
+            cursor.execute(f'CREATE TABLE {qn(f"{table}_{DEFAULT_SUFFIX}")} PARTITION OF {qn(table)} DEFAULT')
+        else:
+            cursor.execute(f'CREATE TABLE {qn(table)} ({like})')
+            cursor.execute(f'ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(pk_name)} PRIMARY KEY ({qn(pk_column)})')
+
+    if partition_by:
+        today = date.today()
+        start = min(first.date(), today) if first else today
+        months = (today.year - start.year) * 12 + today.month - start.month + 1 + ahead
+        create_partitions(table, partition_by, start, months)
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {qn(table)} OVERRIDING SYSTEM VALUE SELECT * FROM {qn(old)}')
+        cursor.execute(f"SELECT setval(pg_get_serial_sequence(%s, %s), COALESCE(MAX({qn(pk_column)}), 0) + 1, false) "
+                       f"FROM {qn(table)}", [table, pk_column])
+        cursor.execute(f'DROP TABLE {qn(old)} CASCADE')
+        for definition in indexes + triggers:
+            cursor.execute(definition)
+        for name, definition in constraints:
+            cursor.execute(f'ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(name)} {definition}')
+
+class PartitionByMonth(Operation):
+    """
+    Migration operation that turns the table of a model into one partitioned by month on a timestamp column,
+    with partitions from the month of its oldest row to `ahead` months from now. the model doesn't change.
+    the table is rewritten under an exclusive lock and can't have foreign keys pointing at it.
+    reversing it puts the rows back in a plain table
+    """
+    reversible = True
+
+    def __init__(self, model_name, column, ahead=3, app_label=None):
+        self.model_name = model_name
+        self.column = column
+        self.ahead = ahead
+        # the app of the model when it isn't the one of the migration, like a third party model
+        self.app_label = app_label
+
+    def deconstruct(self):
+        kwargs = {'ahead': self.ahead}
+        if self.app_label:
+            kwargs['app_label'] = self.app_label
+        return self.__class__.__name__, [self.model_name, self.column], kwargs
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(self.app_label or app_label, self.model_name)
+        _rebuild(schema_editor, model._meta.db_table, partition_by=self.column, ahead=self.ahead)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(self.app_label or app_label, self.model_name)
+        _rebuild(schema_editor, model._meta.db_table)
+
+    def describe(self):
+        return f'Partition {self.model_name} by month of {self.column}'
+
+    @property
+    def migration_name_fragment(self):
+        return f'partition_{self.model_name.lower()}'
@@ -0,0 +1,64 @@
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.db.models import Func
+from django.db.models.fields.json import KeyTextTransform, KeyTransform
+
+# the json type an answer must have to be compared with a range, json orders every type apart
+RANGE_TYPES = {
+    'integer': 'number',
+    'number': 'number',
+    'date': 'string',
+    'date-time': 'string',
+    'time': 'string',
+}
+TEXT_TYPES = ('text', 'paragraph')
+LOOKUPS = ('gte', 'lte', 'contains')
+
+class ResponseQuerySet(models.QuerySet):
+    """
+    Queryset of a model whose `response` answers a list of questions
+    in the format of ActivityTemplate.template_definition and EvaluationTemplate.question_definition
+    """
+    def filter_response(self, questions, conditions):
+        """
+        Filter on the answers. conditions are {title: value} for an equal answer (or a ticked checkbox),
+        {title__gte / title__lte: value} for integer, number, date and time questions
+        and {title__contains: value} for text questions.
+        equality becomes `response @> {...}` which the GIN index serves,
+        ranges compare `response -> title` like the expression indexes of filterable questions
+        """
+        types = {question['title']: question['type'] for question in questions}
+        queryset = self
+        for i, (key, value) in enumerate(conditions.items()):
+            title, _, lookup = key.rpartition('__')
+            if lookup not in LOOKUPS or title not in types:
+                title, lookup = key, 'exact'
+            if title not in types:
+                raise ValidationError(f"unknown question: {title}")
+            question_type = types[title]
+            try:
+                if question_type == 'integer':
+                    value = int(value)
+                elif question_type == 'number':
+                    value = float(value)
+            except ValueError:
+                raise ValidationError(f"{title}: {value!r} is not a valid {question_type}")
+
+            # the aliases are numbered, titles are free text
+            answer = f'_answer_{i}'
+            if lookup == 'exact':
+                queryset = queryset.filter(
+                    response__contains={title: [value] if question_type == 'checkbox' else value}
+                )
+            elif lookup in ('gte', 'lte') and question_type in RANGE_TYPES:
+                queryset = queryset.alias(**{
+                    answer: KeyTransform(title, 'response'),
+                    f'{answer}_type': Func(KeyTransform(title, 'response'), function='jsonb_typeof',
+                                           output_field=models.CharField()),
+                }).filter(**{f'{answer}__{lookup}': value, f'{answer}_type': RANGE_TYPES[question_type]})
+            elif lookup == 'contains' and question_type in TEXT_TYPES:
+                queryset = queryset.alias(**{answer: KeyTextTransform(title, 'response')}) \
+                    .filter(**{f'{answer}__icontains': value})
+            else:
+                raise ValidationError(f"{title}: {lookup} doesn't apply to a {question_type} question")
+        return queryset
@@ -0,0 +1,84 @@
+import csv
+import io
+import re
+import zipfile
+from xml.etree import ElementTree
+
+# an .xlsx is a zip of xml files, its first sheet is read with the standard library
+NS = {'s': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+CELL_RE = re.compile(r'^([A-Z]+)\d+$')
+# the most an xml file of the workbook may expand to, a small upload can unzip to gigabytes
+MAX_XML_SIZE = 50 * 1024 * 1024
+
+def _column(reference):
+    index = 0
+    for letter in CELL_RE.match(reference)[1]:
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+def _number(value):
+    # spreadsheets keep every number as a float, 2024 is written 2024 and not 2024.0
+    number = float(value)
+    return str(int(number)) if number.is_integer() else value
+
+def _read(archive, name):
+    # the sizes in the zip are whatever the writer says, so the read itself is capped too
+    if archive.getinfo(name).file_size > MAX_XML_SIZE:
+        raise ValueError(f'{name} of the workbook is too large')
+    with archive.open(name) as file:
+        data = file.read(MAX_XML_SIZE + 1)
+    if len(data) > MAX_XML_SIZE:
+        raise ValueError(f'{name} of the workbook is too large')
+    return data
+
+def _xlsx_rows(file):
+    with zipfile.ZipFile(file) as archive:
+        names = archive.namelist()
+        strings = []
+        if 'xl/sharedStrings.xml' in names:
+            for item in ElementTree.fromstring(_read(archive, 'xl/sharedStrings.xml')).iterfind('s:si', NS):
+                strings.append(''.join(text.text or '' for text in item.iterfind('.//s:t', NS)))
+        sheets = sorted(name for name in names if re.match(r'^xl/worksheets/sheet\d+\.xml$', name))
+        if not sheets:
+            raise ValueError('the workbook has no sheet')
+        sheet = 'xl/worksheets/sheet1.xml' if 'xl/worksheets/sheet1.xml' in sheets else sheets[0]
+        for row in ElementTree.fromstring(_read(archive, sheet)).iterfind('.//s:sheetData/s:row', NS):
+            values = {}
+            # the reference of a cell is optional, without one it is the cell after the previous
+            column = -1
+            for cell in row.iterfind('s:c', NS):
+                column = _column(cell.get('r')) if cell.get('r') else column + 1
+                kind = cell.get('t')
+                if kind == 'inlineStr':
+                    value = ''.join(text.text or '' for text in cell.iterfind('.//s:t', NS))
+                else:
+                    value = cell.findtext('s:v', '', NS)
+                    if kind == 's' and value:
+                        value = strings[int(value)]
+                    elif kind in (None, 'n') and value:
+                        value = _number(value)
+                values[column] = value
+            yield [values.get(i, '') for i in range(max(values, default=-1) + 1)]
+
+def read_rows(file):
+    """
+    The rows of an uploaded .csv or .xlsx (its first sheet) as dicts keyed by the lowercased headers of the first row,
+    the values stripped. raises ValueError when the file isn't one
+    """
+    name = file.name.lower()
+    try:
+        if name.endswith('.xlsx'):
+            rows = list(_xlsx_rows(file))
+        elif name.endswith('.csv'):
+            rows = list(csv.reader(io.TextIOWrapper(file, encoding='utf-8-sig')))
+        else:
+            raise ValueError('upload a .csv or .xlsx file')
+    except (zipfile.BadZipFile, ElementTree.ParseError, UnicodeDecodeError, csv.Error, KeyError, IndexError) as e:
+        raise ValueError(f'the file could not be read: {e}')
+    if not rows:
+        return []
+    headers = [header.strip().lower() for header in rows[0]]
+    return [
+        {header: (row[i].strip() if i < len(row) else '') for i, header in enumerate(headers) if header}
+        for row in rows[1:] if any(value.strip() for value in row)
+    ]
@@ -1,17 +1,24 @@
+import hmac
+from auditlog.models import LogEntry
 from django import forms
 from django.forms import formset_factory
+from django.conf import settings
 from django.urls import reverse_lazy
 from django.db import transaction
-from django.http import JsonResponse
-from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse, JsonResponse
+from django.core.exceptions import ImproperlyConfigured, PermissionDenied
 from django.views.generic import View, ListView, DeleteView, CreateView, UpdateView, FormView
 from django.contrib.auth.models import Group
 from django.views.decorators.http import require_POST
 from django.forms.models import modelform_factory
 from django.shortcuts import redirect, render
 from apps.organization.models import Faculty, Program
+from apps.organization.tree import get_tree
 from apps.users.managers import UserRLSManager
 from .managers import RLSManager
+from .deletion import bulk_delete
+from . import metrics
+from .audit import log_bulk
 
 class BaseListView(ListView):
     """
@@ -89,6 +96,32 @@ class BaseListView(ListView):
         
         return queryset
 
+class ResponseFilterMixin:
+    """
+    Lets a list of a model with a `response` be filtered on its answers
+    with ?response.<title>=value, ?response.<title>__gte=value and so on, see ResponseQuerySet.filter_response.
+    the questions are response_questions, or what get_response_questions reads when they depend on the request
+    """
+    response_questions = None
+
+    def get_response_questions(self):
+        if self.response_questions is None:
+            raise ImproperlyConfigured(f'{self.__class__.__name__} is missing response_questions or get_response_questions()')
+        return self.response_questions
+
+    def filter_response(self, queryset, conditions):
+        return queryset.filter_response(self.get_response_questions(), conditions)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        conditions = {
+            key.removeprefix('response.'): value
+            for key, value in self.request.GET.items() if key.startswith('response.')
+        }
+        if conditions:
+            queryset = self.filter_response(queryset, conditions)
+        return queryset
+
 class BaseWriteView(FormView):
     """
     Mixin for views that require permission to add or update an object.
@@ -114,8 +147,8 @@ class BaseWriteView(FormView):
             return self.success_url
         return reverse_lazy(f'{self.app_label}:view_{self.model_name}')
     
-    def get_context_data(self):
-        context = super().get_context_data()
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
         context['cancel_url'] = self.get_success_url()
         return context
     
@@ -203,7 +236,7 @@ class BaseBulkDeleteView(BaseWriteView, View):
         return render(request, self.template_name, {'object': f'{self.model._meta.verbose_name_plural}'})
 
     def post(self, request, *args, **kwargs):
-        self.model.objects.get_queryset(request=request).delete()
+        bulk_delete(self.model.objects.get_queryset(request=request), actor=request.user)
         return redirect(f'{self.app_label}:view_{self.model_name}')
     
     def get_context_data(self, **kwargs):
@@ -221,6 +254,12 @@ class BaseImportView(BaseCreateView):
     finally, they can submit the form and it will bulk create all the objects
     """
 
+    def bulk_created(self, instances):
+        """
+        called after the rows were inserted, bulk_create skips the save() of the model and what it does
+        """
+        pass
+
     def _get_default_form(self, request_post=None):
         form_class = self.form_class or modelform_factory(self.model, fields=self.fields)
         form = form_class(request_post or None, request=self.request)
@@ -282,7 +321,9 @@ class BaseImportView(BaseCreateView):
                     instance = form.save(commit=False)
                     instance.clean()
                     instances.append(instance)
-                self.model.objects.bulk_create(instances)   
+                self.model.objects.bulk_create(instances)
+                log_bulk(self.model, LogEntry.Action.CREATE, len(instances))
+                self.bulk_created(instances)
             else:
                 return render(request, self.template_name, {'formset': formset})
         return redirect(f'{self.app_label}:view_{self.model_name}')
@@ -304,7 +345,7 @@ def set_faculty(request):
 
         # now set the program automatically
         if authorized:
-            new_program = Program.objects.filter(faculty=faculty_id).first()
+            new_program = get_tree().programs_of(faculty_id)[0]
         else:
             new_program = user.programs.filter(faculty=faculty_id).first()
         s['selected_program'] = new_program.id
@@ -350,3 +391,18 @@ def set_group(request):
         s['selected_group'] = "None"
         s['permissions'] = []
     return redirect(request.META.get('HTTP_REFERER', '/'))
+
+def metrics_view(request):
+    """
+    The request metrics of every worker in the prometheus text format, for staff only.
+    a scraper sends the METRICS_TOKEN setting as a bearer token instead of logging in,
+    comparing it costs nothing so the endpoint can't be used to guess passwords
+    """
+    if not request.user.is_staff:
+        kind, _, token = request.headers.get('Authorization', '').partition(' ')
+        expected = settings.METRICS_TOKEN
+        if not (expected and kind.lower() == 'bearer' and hmac.compare_digest(token.encode(), expected.encode())):
+            response = HttpResponse('staff only', status=401, content_type='text/plain')
+            response['WWW-Authenticate'] = 'Bearer realm="metrics"'
+            return response
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
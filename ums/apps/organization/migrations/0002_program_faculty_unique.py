@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-19 16:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organization', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='program',
+            constraint=models.UniqueConstraint(fields=('id', 'faculty'), name='program_faculty_unique'),
+        ),
+    ]
@@ -1,7 +1,19 @@
 from django.db import models
 from django.core.exceptions import ValidationError
+from apps.core.constraints import constraint_errors
 from apps.core.managers import RLSManager
 from .models import Faculty, Program
+from .operations import CONSTRAINT_SUFFIX
+from .tree import get_tree
+
+MISMATCH_MESSAGE = 'The selected program does not belong to the assigned faculty.'
+
+def affiliation_checked():
+    """
+    The database checks the program belongs to the faculty (see AddAffiliationForeignKey),
+    its error is raised as the ValidationError clean() would have
+    """
+    return constraint_errors({CONSTRAINT_SUFFIX: {'program': MISMATCH_MESSAGE}})
 
 class OrganizationMixin(models.Model):
     """
@@ -13,16 +25,14 @@ class OrganizationMixin(models.Model):
 
     def clean(self):
         super().clean()
-        if not hasattr(self, 'program') or not hasattr(self, 'faculty'):
+        if self.program_id is None or self.faculty_id is None:
             return
-        if self.faculty != self.program.faculty:
-            raise ValidationError(
-                {'program': 'The selected program does not belong to the assigned faculty.'}
-                )
+        if self.faculty_id != get_tree().faculty_of(self.program_id):
+            raise ValidationError({'program': MISMATCH_MESSAGE})
     
     def save(self, *args, **kwargs):
-        self.clean()
-        super().save(*args, **kwargs)
+        with affiliation_checked():
+            super().save(*args, **kwargs)
     
     class Meta:
         abstract = True
@@ -37,21 +47,18 @@ class OrganizationNullMixin(models.Model):
 
     def clean(self):
         super().clean()
-        if not hasattr(self, 'program') or not hasattr(self, 'faculty') or \
-            not self.program or not self.faculty:
+        if self.program_id is None or self.faculty_id is None:
             return
-        if self.faculty != self.program.faculty:
-            raise ValidationError({
-                'program': 'The selected program does not belong to the assigned faculty.'
-                })
+        if self.faculty_id != get_tree().faculty_of(self.program_id):
+            raise ValidationError({'program': MISMATCH_MESSAGE})
 
     def save(self, *args, **kwargs):
         """
-        Validate that the selected program belongs to the selected faculty.
-        we do it in save and not clean because the form needs to inject affiliation after the clean
+        The database validates that the selected program belongs to the selected faculty.
+        not clean because the form needs to inject affiliation after the clean
         """
-        self.clean()
-        super().save(*args, **kwargs)
+        with affiliation_checked():
+            super().save(*args, **kwargs)
     
     class Meta:
         abstract = True
@@ -69,15 +76,15 @@ class ProgramNullMixin(models.Model):
 
     def clean(self):
         super().clean()
-        if not hasattr(self, 'program') or not hasattr(self, 'faculty') or not self.program:
+        if self.program_id is None or self.faculty_id is None:
             return
-        if self.faculty != self.program.faculty:
-            raise ValidationError({'program': 'The selected program does not belong to the assigned faculty.'})
+        if self.faculty_id != get_tree().faculty_of(self.program_id):
+            raise ValidationError({'program': MISMATCH_MESSAGE})
 
     def save(self, *args, **kwargs):
         """
-        Validate that the selected program belongs to the selected faculty.
-        we do it in save and not clean because the form needs to inject affiliation after the clean
+        The database validates that the selected program belongs to the selected faculty.
+        not clean because the form needs to inject affiliation after the clean
         """
-        self.clean()
-        super().save(*args, **kwargs)        
\ No newline at end of file
+        with affiliation_checked():
+            super().save(*args, **kwargs)        
\ No newline at end of file
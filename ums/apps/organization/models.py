@@ -1,4 +1,5 @@
 from django.db import models
+from .tree import invalidate_tree
 
 # Create your models here.
 class Faculty(models.Model):
@@ -6,6 +7,15 @@ class Faculty(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        invalidate_tree()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        invalidate_tree()
+        return result
+
     class Meta:
         verbose_name_plural = "Faculties"
 
@@ -14,3 +24,18 @@ class Program(models.Model):
     faculty = models.ForeignKey(Faculty, on_delete=models.PROTECT, related_name='programs')
     def __str__(self):
         return self.name
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        invalidate_tree()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        invalidate_tree()
+        return result
+
+    class Meta:
+        constraints = [
+            # what the (program, faculty) foreign keys of the affiliated models point at
+            models.UniqueConstraint(fields=['id', 'faculty'], name='program_faculty_unique'),
+        ]
@@ -0,0 +1,57 @@
+from django.db.migrations.operations.base import Operation
+
+# the program of a row has to be one of its faculty, (program_id, faculty_id) references the program's (id, faculty_id).
+# a row without a program or a faculty isn't checked, moving a program to another faculty moves its rows along
+CONSTRAINT_SUFFIX = 'program_faculty_fk'
+
+def constraint_name(table):
+    return f'{table}_{CONSTRAINT_SUFFIX}'
+
+class AddAffiliationForeignKey(Operation):
+    """
+    Migration operation that makes the database check the program and faculty of a model's rows belong together.
+    the rows already there are checked first and the migration fails listing the ones that don't,
+    the program's (id, faculty) must be unique for the key to point at it
+    """
+    reversible = True
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+    def deconstruct(self):
+        return self.__class__.__name__, [self.model_name], {}
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        program = model._meta.get_field('program').related_model._meta.db_table
+        table = model._meta.db_table
+        qn = schema_editor.quote_name
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT t.id FROM {qn(table)} t JOIN {qn(program)} p ON p.id = t.program_id
+                WHERE p.faculty_id <> t.faculty_id ORDER BY t.id
+            """)
+            if mismatched := [pk for pk, in cursor.fetchall()]:
+                raise ValueError(f"{len(mismatched)} {table} rows have a program of another faculty, "
+                                 f"fix them first: {', '.join(map(str, mismatched[:20]))}")
+            cursor.execute(f"""
+                ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(constraint_name(table))}
+                FOREIGN KEY (program_id, faculty_id) REFERENCES {qn(program)} (id, faculty_id) ON UPDATE CASCADE
+            """)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        table = model._meta.db_table
+        schema_editor.execute(
+            f'ALTER TABLE {schema_editor.quote_name(table)} DROP CONSTRAINT {schema_editor.quote_name(constraint_name(table))}'
+        )
+
+    def describe(self):
+        return f'Check the program of {self.model_name} belongs to its faculty'
+
+    @property
+    def migration_name_fragment(self):
+        return f'{self.model_name.lower()}_affiliation_fk'
@@ -0,0 +1,72 @@
+from dataclasses import dataclass
+from types import MappingProxyType
+from uuid import uuid4
+from django.core.cache import cache
+from django.db import transaction
+
+# the faculties and programs are read once per worker and shared by every request.
+# the stamp in the cache says which tree is current, a save or delete drops it
+# so the next reader makes up a new one and every worker reloads
+VERSION_CACHE_KEY = 'organization:version'
+_tree = None
+
+@dataclass(frozen=True)
+class FacultyNode:
+    id: int
+    name: str
+    program_ids: tuple
+
+    def __str__(self):
+        return self.name
+
+@dataclass(frozen=True)
+class ProgramNode:
+    id: int
+    name: str
+    faculty_id: int
+
+    def __str__(self):
+        return self.name
+
+class OrganizationTree:
+    """
+    Read only faculty -> programs and program -> faculty, both ordered by id
+    """
+    def __init__(self, version, faculties, programs):
+        self.version = version
+        self.faculties = MappingProxyType({faculty.id: faculty for faculty in faculties})
+        self.programs = MappingProxyType({program.id: program for program in programs})
+
+    def faculty_of(self, program_id):
+        program = self.programs.get(program_id)
+        return program.faculty_id if program else None
+
+    def programs_of(self, faculty_id):
+        faculty = self.faculties.get(faculty_id)
+        return [self.programs[program_id] for program_id in faculty.program_ids] if faculty else []
+
+def _load(version):
+    from .models import Faculty, Program
+    programs = [ProgramNode(*row) for row in Program.objects.order_by('pk').values_list('pk', 'name', 'faculty_id')]
+    faculties = [
+        FacultyNode(pk, name, tuple(program.id for program in programs if program.faculty_id == pk))
+        for pk, name in Faculty.objects.order_by('pk').values_list('pk', 'name')
+    ]
+    return OrganizationTree(version, faculties, programs)
+
+def get_tree():
+    """
+    The current organization tree, from this worker's memory unless a faculty or program changed since it was read
+    """
+    global _tree
+    version = cache.get(VERSION_CACHE_KEY)
+    if version is None:
+        cache.add(VERSION_CACHE_KEY, uuid4().hex, None)
+        version = cache.get(VERSION_CACHE_KEY)
+    if _tree is None or _tree.version != version:
+        _tree = _load(version)
+    return _tree
+
+def invalidate_tree():
+    # after commit, or another worker could read the old rows under the new stamp
+    transaction.on_commit(lambda: cache.delete(VERSION_CACHE_KEY))
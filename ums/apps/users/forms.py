@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib.auth.models import Group
-from apps.organization.models import Program, Faculty
+from apps.organization.models import Program
+from apps.organization.tree import get_tree
 from apps.academic.models import Class
 from .models import User, Student
 from .queryset import GroupQuerySet
@@ -45,9 +46,9 @@ class UserForm(forms.ModelForm):
         if (not faculties and not programs) or (faculties and not programs):
             return data
             
-        program_faculties = Faculty.objects.filter(programs__in=programs).distinct()
-        missing_faculties = program_faculties.exclude(id__in=[f.id for f in faculties])
-        if missing_faculties.exists():
+        tree = get_tree()
+        program_faculties = {tree.faculty_of(program.pk) for program in programs}
+        if program_faculties - {faculty.pk for faculty in faculties}:
             self.add_error('programs', f"The selected programs include faculties that are not in the assigned faculties")
         
         return data
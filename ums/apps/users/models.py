@@ -1,6 +1,9 @@
 import random
+from django.apps import apps
 from django.db import models
 from django.db.models import Q
+from django.db.models.functions import Upper
+from django.contrib.postgres.indexes import OpClass
 from django.contrib.auth.models import AbstractUser, Group
 from apps.organization.models import Faculty, Program
 from apps.core.managers import RLSManager
@@ -47,6 +50,13 @@ class User(AbstractUser):
             ("access_faculty_wide", "Faculty Wide Access"),
             ("access_program_wide", "Program Wide Access"),
         ]
+        indexes = [
+            # exact lookup of a professor by name
+            models.Index(fields=['first_name', 'last_name'], name='user_full_name_idx'),
+            # prefix search for the autocomplete (istartswith is UPPER(col) LIKE 'ABC%')
+            models.Index(OpClass(Upper('first_name'), name='text_pattern_ops'), name='user_first_name_prefix_idx'),
+            models.Index(OpClass(Upper('last_name'), name='text_pattern_ops'), name='user_last_name_prefix_idx'),
+        ]
 
 class Student(models.Model):
     user = models.OneToOneField(User, on_delete=models.PROTECT)
@@ -68,6 +78,9 @@ class Student(models.Model):
     def save(self, *args, **kwargs):
         self.clean()
         super().save()
+        # the student's timetable is the one of its class
+        from apps.academic.timetable import invalidate_timetables
+        invalidate_timetables()
     
     def delete(self, *args, **kwargs):
         """
@@ -84,9 +97,13 @@ class Student(models.Model):
             self.user.groups.remove(student_group)
 
         super().delete(*args, **kwargs)
+        from apps.academic.timetable import invalidate_timetables
+        invalidate_timetables()
     
     def get_user_rls_filter(self, user):
         """
-        the class one is teaching or the user is yourself
+        the class one is teaching or the user is yourself.
+        the classes are a subquery, joining the schedules would repeat a student per course one teaches them
         """
-        return Q(user=user) | Q(_class__professor=user)
\ No newline at end of file
+        Schedule = apps.get_model('academic', 'Schedule')
+        return Q(user=user) | Q(_class__in=Schedule.objects.filter(professor=user).values('_class'))
\ No newline at end of file
@@ -10,6 +10,7 @@ urlpatterns = [
     path('create/', views.UserCreateView.as_view(), name='add_user'),
     path('change/<int:pk>/', views.UserUpdateView.as_view(), name='change_user'),
     path('delete/<int:pk>/', views.UserDeleteView.as_view(), name='delete_user'),
+    path('autocomplete/', views.autocomplete_user, name='autocomplete_user'),
     # student
     path('students/', views.StudentListView.as_view(), name='view_student'),
     path('students/import/', views.StudentImportView.as_view(), name='import_student'),
@@ -1,4 +1,9 @@
+from django.db.models import Q
+from django.http import JsonResponse
+from django.core.exceptions import PermissionDenied
+from django.views.decorators.http import require_GET
 from apps.core.views import BaseListView, BaseCreateView, BaseUpdateView, BaseDeleteView, BaseImportView
+from apps.academic.timetable import invalidate_timetables
 from .models import Student, User
 from .forms import UserForm, StudentForm
 
@@ -45,6 +50,10 @@ class StudentListView(BaseListView):
 class StudentImportView(BaseImportView):
     model = Student
     form_class = StudentForm
+
+    def bulk_created(self, instances):
+        # like Student.save, the students' timetables are the ones of their classes
+        invalidate_timetables()
     
 class StudentCreateView(BaseCreateView):
     model = Student
@@ -69,4 +78,23 @@ class StudentUpdateView(StudentCreateView, BaseUpdateView):
         return initial
 
 class StudentDeleteView(BaseDeleteView):
-    model = Student
\ No newline at end of file
+    model = Student
+
+@require_GET
+def autocomplete_user(request):
+    """
+    Typeahead for picking a professor, answers in the select2 format.
+    every word of the term has to prefix either the first or last name
+    """
+    s = request.session
+    if not any(perm in s.get('permissions', []) for perm in ['view_user', 'change_class']):
+        raise PermissionDenied("You do not have permission to access this page.")
+
+    queryset = User.objects.get_queryset(request=request).filter(student__isnull=True)
+    for word in request.GET.get('term', '').split():
+        queryset = queryset.filter(Q(first_name__istartswith=word) | Q(last_name__istartswith=word))
+    users = queryset.order_by('first_name', 'last_name').values('id', 'first_name', 'last_name', 'email')[:20]
+
+    return JsonResponse({'results': [
+        {'id': u['id'], 'text': f"{u['first_name']} {u['last_name']} ({u['email']})"} for u in users
+    ]})
@@ -2,6 +2,7 @@
 from django.contrib import admin
 from django.conf import settings
 from django.urls import path, include
+from apps.core.views import metrics_view
 from .views import home_view
 
 urlpatterns = [
@@ -11,6 +12,7 @@ urlpatterns = [
     path('activities/', include('apps.activities.urls')),
     path('users/', include('apps.users.urls')),
     path('academic/', include('apps.academic.urls')),
+    path('metrics', metrics_view, name='metrics'),
     path('', home_view, name='home'),
 ]   
 